@@ -0,0 +1,55 @@
+"""Chart buckets and per-category series from the category-grouped report queries."""
+from datetime import timedelta
+
+import numpy as np
+
+from categories import CATEGORIES
+
+CATEGORY_CODES = {name: code for code, name in enumerate(CATEGORIES)}
+
+# Finest granularity whose bucket count stays small, by the longest range (in days) it
+# is used for; longer ranges are reported per month
+GRANULARITY_SPANS = [('hour', 2), ('day', 62), ('week', 366)]
+
+
+def pick_granularity(days):
+    for granularity, longest in GRANULARITY_SPANS:
+        if days <= longest:
+            return granularity
+    return 'month'
+
+
+def range_buckets(start, end, granularity):
+    """Keys of every bucket between two dates, as reported by get_category_series."""
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if granularity == 'hour':
+        return [f"{day} {h:02d}" for day in days for h in range(24)]
+    if granularity == 'day':
+        return [str(day) for day in days]
+    if granularity == 'week':
+        monday = start - timedelta(days=start.weekday())
+        return [str(monday + timedelta(days=i)) for i in range(0, (end - monday).days + 1, 7)]
+    return list(dict.fromkeys(day.strftime('%Y-%m') for day in days))
+
+
+def category_series(rows, bucket_keys):
+    """len(bucket_keys) x len(CATEGORIES) array of minutes from (bucket_key, category,
+    minutes) rows; rows of other buckets are left out."""
+    matrix = np.zeros((len(bucket_keys), len(CATEGORIES)))
+    bucket_index = {key: i for i, key in enumerate(bucket_keys)}
+    for key, category, minutes in rows:
+        i = bucket_index.get(key)
+        if i is not None:
+            matrix[i, CATEGORY_CODES[category]] += minutes or 0
+    return matrix
+
+
+def heatmap_cube(rows, n_rows, first_slot=0):
+    """Sum (slot, category code, minutes) rows from get_category_minutes into a
+    len(CATEGORIES) x n_rows x 24 array, row (slot - first_slot) // 24 and column slot % 24."""
+    cube = np.zeros(len(CATEGORIES) * n_rows * 24)
+    if rows:
+        rows = np.array(rows, dtype=np.float64)
+        slot, code = rows[:, 0].astype(np.int64) - first_slot, rows[:, 1].astype(np.int64)
+        cube = np.bincount(code * n_rows * 24 + slot, weights=rows[:, 2], minlength=cube.size)
+    return cube.reshape(len(CATEGORIES), n_rows, 24)
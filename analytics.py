@@ -0,0 +1,159 @@
+"""Sessions, context switches and focus streaks, computed in one streaming pass.
+
+Usage rows are fragments: the tracker writes a row on every window change and every
+few seconds while a window keeps focus. sessions() reads them in start_time order and
+merges consecutive fragments of the same app into sessions; summarize() folds sessions
+into distributions without keeping them. Memory depends on the number of apps, users
+and hours of the day, not on the number of rows, so a year of data is fine.
+
+Rows from several hosts or users (see /api/ingest) are sessionized separately.
+"""
+import heapq
+import math
+from datetime import datetime, timedelta
+
+import database
+
+GAP_SECONDS = 60  # fragments of the same app closer than this are one session
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+
+class QuantileSketch:
+    """Streaming quantiles with bounded relative error, after DDSketch.
+
+    Values are counted in logarithmic buckets, so memory grows with log(max / min)
+    rather than with the number of values, and sketches can be merged.
+    """
+    def __init__(self, accuracy=0.01):
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if value <= 0:
+            self.zeros += 1
+            return
+        key = math.ceil(math.log(value) / self.log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other):
+        for key, n in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + n
+        self.zeros += other.zeros
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        if rank < self.zeros:
+            return 0.0
+        seen = self.zeros
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(k-1), gamma^k], within the accuracy bound
+                return min(2 * self.gamma ** key / (self.gamma + 1), self.max)
+        return self.max
+
+    def summary(self):
+        out = {'count': self.count, 'mean': self.total / self.count if self.count else None,
+               'max': self.max if self.count else None}
+        for q in QUANTILES:
+            out[f'p{round(q * 100)}'] = self.quantile(q)
+        return out
+
+
+def sessions(rows, gap=GAP_SECONDS, exclude=()):
+    """Merge (host, user, app_name, start_time, end_time) rows, ordered by start_time, into
+    (host, user, app_name, start, end) sessions with datetime start and end.
+
+    Rows of apps in ``exclude`` (lowercase names) are skipped, as if the user was away.
+    Sessions of one host/user come out in order; different ones may interleave.
+    """
+    gap = timedelta(seconds=gap)
+    current = {}  # (host, user) -> [app_name, start, end]
+    for host, user, app_name, start_time, end_time in rows:
+        if not app_name or not start_time or app_name.lower() in exclude:
+            continue
+        start = datetime.fromisoformat(start_time)
+        end = datetime.fromisoformat(end_time) if end_time else start
+        key = (host, user)
+        cur = current.get(key)
+        if cur is not None and cur[0] == app_name and start - cur[2] <= gap:
+            if end > cur[2]:
+                cur[2] = end
+            continue
+        if cur is not None:
+            yield (host, user, cur[0], cur[1], cur[2])
+        current[key] = [app_name, start, end]
+    for (host, user), cur in current.items():
+        yield (host, user, cur[0], cur[1], cur[2])
+
+
+def summarize(session_iter, gap=GAP_SECONDS, top=10, top_apps=20):
+    """Session length distribution (minutes), context switches per hour of the day and
+    the longest focus streaks, from a sessions() stream."""
+    gap = timedelta(seconds=gap)
+    overall = QuantileSketch()
+    per_app = {}  # app_name -> QuantileSketch
+    switches = [0] * 24
+    active_hours = set()  # (date, hour) with any activity
+    last = {}  # (host, user) -> (app_name, end) of the previous session
+    longest = []  # min-heap of (minutes, start, app_name, end)
+    for host, user, app_name, start, end in session_iter:
+        minutes = (end - start).total_seconds() / 60.0
+        overall.add(minutes)
+        sketch = per_app.get(app_name)
+        if sketch is None:
+            sketch = per_app[app_name] = QuantileSketch()
+        sketch.add(minutes)
+        prev = last.get((host, user))
+        # Moving straight to another app is a switch; coming back after a break is not
+        if prev is not None and prev[0] != app_name and start - prev[1] <= gap:
+            switches[start.hour] += 1
+        last[(host, user)] = (app_name, end)
+        hour = start.replace(minute=0, second=0, microsecond=0)
+        while True:
+            active_hours.add(hour)
+            hour += timedelta(hours=1)
+            if hour >= end:
+                break
+        entry = (minutes, start, app_name, end)
+        if len(longest) < top:
+            heapq.heappush(longest, entry)
+        elif entry > longest[0]:
+            heapq.heapreplace(longest, entry)
+    hours_active = [0] * 24
+    for hour in active_hours:
+        hours_active[hour.hour] += 1
+    apps = sorted(per_app.items(), key=lambda item: -item[1].total)[:top_apps]
+    return {
+        'sessions': overall.summary(),
+        'total_minutes': overall.total,
+        'apps': [dict(app=app_name, minutes=sketch.total, **sketch.summary()) for app_name, sketch in apps],
+        'context_switches': {
+            'total': sum(switches),
+            'by_hour': [{'hour': h, 'switches': switches[h], 'active_hours': hours_active[h],
+                         'per_hour': switches[h] / hours_active[h] if hours_active[h] else 0.0}
+                        for h in range(24)],
+        },
+        'longest_streaks': [{'app': app_name, 'start': start.isoformat(sep=' '), 'end': end.isoformat(sep=' '),
+                             'minutes': minutes}
+                            for minutes, start, app_name, end in sorted(longest, reverse=True)],
+    }
+
+
+def session_report(start_date, end_date, gap=GAP_SECONDS, top=10, exclude=()):
+    """summarize() over every usage row between two dates (inclusive)."""
+    rows = database.iter_usage_intervals(start_date, end_date)
+    return summarize(sessions(rows, gap, exclude), gap, top)
@@ -0,0 +1,355 @@
+"""Latency, memory and startup benchmarks for the database queries and the web API.
+
+Each query in database.py and the heavy API endpoints are run against generated
+databases (see generate_data.py) of increasing size, and the cold import time of the
+main modules is measured with ``python -X importtime``. p50/p95 latency and peak Python
+heap use (tracemalloc) are written as JSON so runs can be compared between commits.
+Queries and endpoints are timed with the query cache cleared before every run, and
+again as "(cached)" cases served from it.
+
+With --parallel, reports over the whole history are also run sharded by month on
+reports.ReportExecutor with each --processes pool size, and their speedup over the
+single-query versions is reported.
+
+Example:
+    python benchmark.py --sizes 10k 1m --output bench.json
+    python benchmark.py --sizes 10k --compare bench.json
+    python benchmark.py --sizes 10m --parallel --only none --skip-startup
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import database
+import generate_data
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+# Roughly what generate_data produces per user per day with its defaults
+ROWS_PER_USER_DAY = 5000
+
+
+def size_to_rows(size):
+    size = size.lower()
+    if size in SIZES:
+        return SIZES[size]
+    return int(size)
+
+
+def ensure_database(data_dir, size, seed):
+    """Generate (or reuse) a database of about ``size`` rows and return its path."""
+    target = size_to_rows(size)
+    path = os.path.join(data_dir, f'bench_{size.lower()}_seed{seed}.db')
+    if os.path.exists(path):
+        return path
+    os.makedirs(data_dir, exist_ok=True)
+    user_days = max(1, round(target / ROWS_PER_USER_DAY))
+    users = max(1, -(-user_days // 365))
+    days = max(1, round(user_days / users))
+    args = generate_data.parse_args([
+        '--db', path, '--days', str(days), '--users', str(users), '--seed', str(seed),
+        '--end-date', datetime.now().strftime('%Y-%m-%d'),
+    ])
+    print(f'Generating {path} ({days} days x {users} users)...', flush=True)
+    generate_data.generate(args)
+    return path
+
+
+def query_cases():
+    """(name, callable) pairs for every query benchmarked."""
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())
+    week_end = week_start + timedelta(days=6)
+    month_end = today.replace(day=1) - timedelta(days=1)
+    month_start = month_end.replace(day=1)
+    return [
+        ('get_usage_today', lambda: database.get_usage_today()),
+        ('get_usage_range', lambda: database.get_usage_range(str(month_start), str(month_end))),
+        ('get_usage_by_hour', lambda: database.get_usage_by_hour(str(today))),
+        ('get_usage_by_day', lambda: database.get_usage_by_day(str(week_start), str(week_end))),
+        ('get_usage_by_week', lambda: database.get_usage_by_week(str(month_start), str(month_end))),
+        ('get_website_usage_today', lambda: database.get_website_usage_today()),
+        ('get_website_usage_range', lambda: database.get_website_usage_range(str(month_start), str(month_end))),
+        ('get_website_usage_by_hour', lambda: database.get_website_usage_by_hour(str(today))),
+        ('get_website_usage_by_day', lambda: database.get_website_usage_by_day(str(week_start), str(week_end))),
+        ('get_website_usage_by_week', lambda: database.get_website_usage_by_week(str(month_start), str(month_end))),
+        ('get_top_used_apps', lambda: database.get_top_used_apps()),
+        ('get_top_websites', lambda: database.get_top_websites()),
+        ('get_latest_window_titles', lambda: database.get_latest_window_titles()),
+        ('get_display_names', lambda: database.get_display_names()),
+    ]
+
+
+def endpoint_cases():
+    """(name, callable) pairs for the API endpoints, using Flask's test client."""
+    import webapp
+    client = webapp.app.test_client()
+
+    def get(url):
+        def run():
+            response = client.get(url)
+            if response.status_code != 200:
+                raise RuntimeError(f'{url} returned {response.status_code}')
+            return response.get_data()
+        return run
+    return [
+        ('GET /api/usage_data?period=today', get('/api/usage_data?period=today')),
+        ('GET /api/usage_data?period=last_week', get('/api/usage_data?period=last_week')),
+        ('GET /api/usage_data?period=last_month', get('/api/usage_data?period=last_month')),
+        ('GET /api/app_limits', get('/api/app_limits')),
+    ]
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def measure(fn, repeat, warmup, before=None):
+    """Time fn; before(), if given, runs untimed ahead of every run (e.g. to clear caches)."""
+    for _ in range(warmup):
+        if before:
+            before()
+        fn()
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - started) * 1000.0)
+    timings.sort()
+    # Peak memory is measured in a separate run so tracing does not skew the timings
+    if before:
+        before()
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'p50_ms': round(percentile(timings, 50), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'min_ms': round(timings[0], 3),
+        'peak_kib': round(peak / 1024.0, 1),
+        'runs': repeat,
+    }
+
+
+def parallel_cases(path, executors):
+    """(name, baseline name, callable) for reports over the whole history: run as one
+    query in this process, then sharded by month on each ReportExecutor."""
+    import reports
+    conn = sqlite3.connect(path)
+    start, end = conn.execute('SELECT MIN(date(start_time)), MAX(date(start_time)) FROM usage_facts').fetchone()
+    conn.close()
+    end_exclusive = str(datetime.strptime(end, '%Y-%m-%d').date() + timedelta(days=1))
+
+    def weekly_uncached():
+        # Every run has to do the work, not read the previous result from the query cache
+        database._query_cache.clear()
+        return database.get_usage_by_week(start, end)
+    cases = [
+        # Precomputed all-time totals, for reference
+        ('get_top_used_apps', None, lambda: database.get_top_used_apps()),
+        ('top apps, one query', None, lambda: reports.run_shard(path, 'top_apps', start, end_exclusive)),
+        ('get_usage_by_week, one query', None, weekly_uncached),
+    ]
+    for processes, executor in executors.items():
+        cases.append((f'top apps, {processes} processes', 'top apps, one query',
+                      lambda e=executor: e.top_apps(start, end)))
+        cases.append((f'usage by week, {processes} processes', 'get_usage_by_week, one query',
+                      lambda e=executor: e.usage_by_week(start, end)))
+    return cases
+
+
+def run_parallel(path, size, args, base_entry):
+    """Measure parallel_cases; the sharded entries get their speedup over one query."""
+    import reports
+    executors = {n: reports.ReportExecutor(n, path) for n in args.processes}
+    results = []
+    p50 = {}
+    try:
+        for name, baseline, fn in parallel_cases(path, executors):
+            stats = measure(fn, args.repeat, args.warmup)
+            p50[name] = stats['p50_ms']
+            entry = dict(base_entry, kind='parallel', name=name)
+            entry.update(stats)
+            speedup = ''
+            if baseline and stats['p50_ms']:
+                entry['speedup'] = round(p50[baseline] / stats['p50_ms'], 2)
+                speedup = f"  x{entry['speedup']:.2f}"
+            results.append(entry)
+            print(f"{size:>4} {name:<45} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms{speedup}",
+                  flush=True)
+    finally:
+        for executor in executors.values():
+            executor.close()
+    return results
+
+
+def count_rows(path):
+    conn = sqlite3.connect(path)
+    usage = conn.execute('SELECT COUNT(*) FROM usage_facts').fetchone()[0]
+    website = conn.execute('SELECT COUNT(*) FROM website_facts').fetchone()[0]
+    conn.close()
+    return usage, website
+
+
+def database_bytes(path):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    conn.close()
+    return os.path.getsize(path)
+
+
+def measure_import_time(module, repeat):
+    """Import cost of ``module`` in fresh interpreters, from ``python -X importtime``."""
+    here = os.path.dirname(os.path.abspath(__file__))
+    totals = []
+    children = {}
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              capture_output=True, text=True, cwd=here)
+        if proc.returncode != 0:
+            raise ImportError(proc.stderr.strip().splitlines()[-1])
+        for line in proc.stderr.splitlines():
+            if not line.startswith('import time:') or 'imported package' in line:
+                continue
+            _, cumulative, name = line[len('import time:'):].split('|')
+            if name.strip() == module and not name[1:].startswith(' '):
+                totals.append(int(cumulative) / 1000.0)
+            elif name.startswith('   ') and not name.startswith('     '):
+                # Direct imports of the module are nested one level deep
+                children.setdefault(name.strip(), []).append(int(cumulative) / 1000.0)
+    totals.sort()
+    heaviest = sorted(((min(v), k) for k, v in children.items()), reverse=True)[:10]
+    return {
+        'p50_ms': round(percentile(totals, 50), 3),
+        'p95_ms': round(percentile(totals, 95), 3),
+        'min_ms': round(totals[0], 3),
+        'runs': repeat,
+        'heaviest_imports_ms': {name: round(ms, 3) for ms, name in heaviest},
+    }
+
+
+def git_commit():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(args):
+    results = []
+    if not args.skip_startup:
+        for module in args.startup_modules:
+            try:
+                stats = measure_import_time(module, args.startup_repeat)
+            except ImportError as e:
+                print(f'Skipping import of {module}: {e}', file=sys.stderr)
+                continue
+            entry = {'size': None, 'kind': 'startup', 'name': f'import {module}'}
+            entry.update(stats)
+            results.append(entry)
+            print(f"     {'import ' + module:<45} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms", flush=True)
+    for size in args.sizes:
+        path = ensure_database(args.data_dir, size, args.seed)
+        database.DB_NAME = path
+        # Brings databases generated by older commits up to the current schema
+        database.init_db()
+        usage_rows, website_rows = count_rows(path)
+        db_bytes = database_bytes(path)
+        cases = [('query', name, fn) for name, fn in query_cases()]
+        if not args.skip_endpoints:
+            try:
+                cases += [('endpoint', name, fn) for name, fn in endpoint_cases()]
+            except ImportError as e:
+                print(f'Skipping endpoints, webapp could not be imported: {e}', file=sys.stderr)
+        base_entry = {'size': size, 'usage_rows': usage_rows, 'website_rows': website_rows, 'db_bytes': db_bytes}
+        for kind, name, fn in cases:
+            if args.only and not any(o in name for o in args.only):
+                continue
+            # Every run does the work; the same case served from the query cache is
+            # reported separately
+            for label, before in ((name, database._query_cache.clear), (f'{name} (cached)', None)):
+                stats = measure(fn, args.repeat, args.warmup, before)
+                entry = dict(base_entry, kind=kind if before else f'{kind}_cached', name=label)
+                entry.update(stats)
+                results.append(entry)
+                print(f"{size:>4} {label:<45} p50 {stats['p50_ms']:>9.2f} ms  p95 {stats['p95_ms']:>9.2f} ms  "
+                      f"peak {stats['peak_kib']:>9.1f} KiB", flush=True)
+        if args.parallel:
+            results += run_parallel(path, size, args, base_entry)
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current):
+    """Print p50 ratios of ``current`` against ``baseline`` for matching entries."""
+    old = {(r['size'], r['name']): r for r in baseline['results']}
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for r in current['results']:
+        prev = old.get((r['size'], r['name']))
+        if not prev or not prev['p50_ms']:
+            continue
+        ratio = r['p50_ms'] / prev['p50_ms']
+        print(f"{r['size']:>4} {r['name']:<45} {prev['p50_ms']:>9.2f} -> {r['p50_ms']:>9.2f} ms  x{ratio:.2f}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark database queries and API endpoints.')
+    parser.add_argument('--sizes', nargs='+', default=['10k', '1m', '10m'],
+                        help='database sizes in rows (10k, 1m, 10m or a number)')
+    parser.add_argument('--data-dir', default='bench_data', help='where generated databases are cached')
+    parser.add_argument('--seed', type=int, default=0, help='generator seed')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per case')
+    parser.add_argument('--warmup', type=int, default=2, help='untimed runs per case')
+    parser.add_argument('--only', nargs='*', help='only run cases whose name contains one of these')
+    parser.add_argument('--skip-endpoints', action='store_true', help='only benchmark database.py')
+    parser.add_argument('--skip-startup', action='store_true', help='do not measure module import time')
+    parser.add_argument('--startup-modules', nargs='+', default=['webapp', 'database', 'tracker'],
+                        help='modules whose cold import time is measured')
+    parser.add_argument('--startup-repeat', type=int, default=5, help='fresh interpreters per import measurement')
+    parser.add_argument('--parallel', action='store_true',
+                        help='also time whole-history reports on reports.ReportExecutor')
+    parser.add_argument('--processes', nargs='+', type=int, default=[1, 2, 4, 8],
+                        help='process pool sizes for --parallel')
+    parser.add_argument('--output', default='bench_results.json', help='JSON results file')
+    parser.add_argument('--compare', help='previous JSON results to compare against')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run(args)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""App and website categories.
+
+Every app and site gets a category when the write path first sees its name (stored as
+apps.category_id / sites.category_id), and reports group by the stored category in
+SQL. A category changed later, from the dashboard or with database.set_category, is
+one row update plus moving that app's minutes between the category rollups.
+
+Time in SYSTEM_PROCESSES is stored but never reported; the category rollups leave it
+out when rows are written.
+
+The database triggers behind the old usage_logs / website_usage_logs tables cannot call
+categorize(), so they look names up in a table of category_rules() instead.
+"""
+from sites import KNOWN_SITES, site_category
+
+CATEGORIES = ('Productive', 'Distracting', 'Others')
+
+# Windows shell and background processes (lowercase)
+SYSTEM_PROCESSES = set([
+    "explorer.exe", "shellexperiencehost.exe", "searchhost.exe",
+    "system", "system idle process", "runtimebroker.exe", "startmenuexperiencehost.exe",
+    "ctfmon.exe", "dwm.exe", "fontdrvhost.exe", "taskhostw.exe", "smartscreen.exe",
+    "securityhealthservice.exe", "searchui.exe", "searchapp.exe", "applicationframehost.exe"
+])
+
+# Substrings of app and site names, checked in this order
+PRODUCTIVE = set([
+    # Code editors
+    "vscode", "visual studio code", "pycharm", "sublime", "sublime text", "atom", "webstorm", "intellij", "clion", "android studio", "eclipse", "netbeans", "brackets", "notepad++", "notepadqq", "xcode",
+    # Notes
+    "notion", "onenote", "simplenote", "evernote", "joplin", "obsidian", "standard notes", "google keep", "apple notes",
+    # Office
+    "word", "excel", "powerpoint", "outlook", "onenote", "office", "libreoffice", "openoffice", "google docs", "google sheets", "google slides", "wps office",
+    # Communication/Productivity
+    "teams", "slack", "zoom", "github desktop", "trello", "asana", "todoist", "clickup", "jira", "confluence"
+])
+DISTRACTING = set([
+    # Social/entertainment websites
+    "youtube", "instagram", "facebook", "twitter", "reddit", "tiktok", "netflix", "discord", "pinterest", "tumblr", "twitch", "roblox", "prime video", "quora", "9gag", "bilibili", "vk", "weibo", "imgur", "kick", "onlyfans", "snapchat", "threads", "mastodon", "clubhouse", "soundcloud", "spotify", "apple music", "gaana", "wynk", "jiosaavn", "amazon music", "pandora", "deezer", "audible"
+])
+OTHERS = set([
+    # Browsers
+    "chrome", "google chrome", "firefox", "mozilla firefox", "edge", "microsoft edge", "opera", "brave", "vivaldi", "safari", "chromium",
+    # Music apps
+    "spotify", "itunes", "vlc", "windows media player", "groove music", "winamp", "foobar2000", "audacious", "rhythmbox", "banshee", "amarok", "clementine", "musicbee", "apple music", "amazon music", "youtube music", "pandora", "deezer", "soundcloud", "audible"
+])
+
+def categorize(name):
+    """Category for an app or site name; the write path stores it when the name is first seen."""
+    # Known websites have their own category
+    category = site_category(name)
+    if category:
+        return category
+    n = name.lower()
+    # Productive
+    if any(p in n for p in PRODUCTIVE):
+        return 'Productive'
+    # Distracting (websites and apps)
+    if any(d in n for d in DISTRACTING):
+        return 'Distracting'
+    # Others (browsers, music apps)
+    if any(o in n for o in OTHERS):
+        return 'Others'
+    # Default
+    return 'Others'
+
+def category_rules():
+    """(pattern, exact, priority, category) rules equivalent to categorize(): the first
+    match by priority wins, exact rules compare the whole name and the others look for
+    the pattern in the lowercased name. A name matching none is 'Others'."""
+    return ([(domain, True, 0, category) for domain, category, _ in KNOWN_SITES] +
+            [(p, False, 1, 'Productive') for p in sorted(PRODUCTIVE)] +
+            [(d, False, 2, 'Distracting') for d in sorted(DISTRACTING)])
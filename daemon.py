@@ -0,0 +1,326 @@
+"""Standalone tracker process that owns the write path, with a local IPC channel for UIs.
+
+Only one tracker should write to the database, so ui.py and webapp.py talk to a single
+daemon instead of each running their own. The daemon listens on 127.0.0.1 (TCP, so it
+works the same on Windows) and speaks newline-delimited JSON:
+
+    -> {"op":"state"}                    <- {"ok":true,"state":{...}}
+    -> {"op":"start"} / {"op":"stop"}    <- {"ok":true,"state":{...}}
+    -> {"op":"stats"}                    <- {"ok":true,"stats":{...}}
+    -> {"op":"exe_map"}                  <- {"ok":true,"exe_map":{...}}
+    -> {"op":"shutdown"}                 <- {"ok":true}, then the tracker stops and the daemon exits
+    -> {"op":"subscribe"}                <- {"ev":"state","state":{...}} then one event per line:
+                                            switch / state / alert, each with the full live state
+
+Run it with ``python daemon.py``; frontends get a tracker through ``connect_tracker()``
+and hand it to ``release_tracker()`` on exit.
+"""
+import argparse
+import json
+import os
+import queue
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import database
+import journal
+from tracker import Tracker
+
+DAEMON_HOST = '127.0.0.1'
+DAEMON_PORT = int(os.environ.get('APPUSAGE_DAEMON_PORT', 5055))
+# auto: use the daemon, spawning it if needed; off: track in-process like before
+DAEMON_MODE = os.environ.get('APPUSAGE_DAEMON', 'auto')
+HEARTBEAT_SECONDS = 5
+SUBSCRIBER_QUEUE_SIZE = 256
+
+
+def _encode(msg):
+    return (json.dumps(msg, separators=(',', ':'), default=str) + '\n').encode('utf-8')
+
+
+class TrackerDaemon(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = False  # a second daemon must fail to bind, not share the port
+
+    def __init__(self, host=DAEMON_HOST, port=DAEMON_PORT, alert_callback=None, poll_interval=1):
+        super().__init__((host, port), DaemonHandler)
+        self.alert_callback = alert_callback
+        self.tracker = Tracker(alert_callback=self._on_alert, poll_interval=poll_interval,
+                               switch_callback=self._on_switch)
+        self.subscribers = set()
+        self.subscribers_lock = threading.Lock()
+
+    def live_state(self):
+        t = self.tracker
+        return {
+            'running': t.is_running(),
+            'app': t.current_app,
+            'title': t.current_title,
+            'start': t.start_time.isoformat() if t.start_time else None,
+            'site': t.current_site,
+        }
+
+    def publish(self, event, **fields):
+        msg = {'ev': event, 'state': self.live_state()}
+        msg.update(fields)
+        with self.subscribers_lock:
+            subscribers = list(self.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(msg)
+            except queue.Full:
+                # A subscriber that stopped reading is dropped rather than slowing the tracker
+                self.remove_subscriber(q)
+
+    def add_subscriber(self):
+        q = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self.subscribers_lock:
+            self.subscribers.add(q)
+        return q
+
+    def remove_subscriber(self, q):
+        with self.subscribers_lock:
+            self.subscribers.discard(q)
+
+    def _on_switch(self, app_name, title, start_time):
+        self.publish('switch')
+
+    def _on_alert(self, app_name, duration, max_minutes):
+        self.publish('alert', app=app_name, duration=duration, limit=max_minutes)
+        if self.alert_callback:
+            self.alert_callback(app_name, duration, max_minutes)
+
+    def handle_op(self, op):
+        if op == 'state':
+            return {'ok': True, 'state': self.live_state()}
+        if op == 'start':
+            self.tracker.start()
+            self.publish('state')
+            return {'ok': True, 'state': self.live_state()}
+        if op == 'stop':
+            self.tracker.stop()
+            self.publish('state')
+            return {'ok': True, 'state': self.live_state()}
+        if op == 'stats':
+            return {'ok': True, 'stats': self.tracker.get_stats()}
+        if op == 'exe_map':
+            return {'ok': True, 'exe_map': dict(self.tracker.get_app_exe_map())}
+        if op == 'shutdown':
+            self.shutdown_tracker()
+            self.publish('state')
+            # shutdown() waits for serve_forever, so it cannot run on this handler's thread
+            threading.Thread(target=self.shutdown, daemon=True).start()
+            return {'ok': True}
+        return {'ok': False, 'error': f'unknown op: {op}'}
+
+    def shutdown_tracker(self):
+        self.tracker.stop()
+
+
+class DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                op = json.loads(line).get('op')
+            except (ValueError, AttributeError):
+                self.wfile.write(_encode({'ok': False, 'error': 'malformed message'}))
+                continue
+            if op == 'subscribe':
+                self._stream_events()
+                return
+            self.wfile.write(_encode(self.server.handle_op(op)))
+
+    def _stream_events(self):
+        q = self.server.add_subscriber()
+        try:
+            self.wfile.write(_encode({'ev': 'state', 'state': self.server.live_state()}))
+            while True:
+                try:
+                    msg = q.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Heartbeat keeps clients fresh and detects dead connections
+                    msg = {'ev': 'state', 'state': self.server.live_state()}
+                self.wfile.write(_encode(msg))
+        except OSError:
+            pass
+        finally:
+            self.server.remove_subscriber(q)
+
+
+def request(op, host=DAEMON_HOST, port=DAEMON_PORT, timeout=2.0):
+    """Send one request to the daemon and return its reply. Raises OSError if unreachable."""
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(_encode({'op': op}))
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError('daemon closed the connection')
+    return json.loads(line)
+
+
+def is_running(host=DAEMON_HOST, port=DAEMON_PORT):
+    try:
+        return request('state', host, port, timeout=0.5).get('ok', False)
+    except (OSError, ValueError):
+        return False
+
+
+def spawn(host=DAEMON_HOST, port=DAEMON_PORT, wait=5.0):
+    """Start a detached daemon process and wait until it answers. Returns True on success."""
+    args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'daemon.py'),
+            '--host', host, '--port', str(port), '--db', os.path.abspath(database.DB_NAME)]
+    kwargs = {'stdin': subprocess.DEVNULL, 'stdout': subprocess.DEVNULL, 'stderr': subprocess.DEVNULL}
+    if sys.platform == 'win32':
+        kwargs['creationflags'] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs['start_new_session'] = True
+    subprocess.Popen(args, **kwargs)
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if is_running(host, port):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+class RemoteTracker:
+    """Tracker look-alike for frontends, backed by the daemon.
+
+    Live state (current app, title, start time, running) is kept up to date from the
+    daemon's event stream, so reading it never touches the database or the network.
+    """
+
+    def __init__(self, host=DAEMON_HOST, port=DAEMON_PORT, on_event=None, spawned=False):
+        self.host = host
+        self.port = port
+        self.on_event = on_event
+        # Whether this frontend started the daemon, and so shuts it down on exit
+        self.spawned = spawned
+        self.running = False
+        self.current_app = None
+        self.current_title = None
+        self.start_time = None
+        self.current_site = None
+        self._apply(request('state', host, port)['state'])
+        self._thread = threading.Thread(target=self._subscribe_loop, daemon=True)
+        self._thread.start()
+
+    def _apply(self, state):
+        self.running = state['running']
+        self.current_app = state['app']
+        self.current_title = state['title']
+        self.start_time = datetime.fromisoformat(state['start']) if state['start'] else None
+        self.current_site = state['site']
+
+    def _subscribe_loop(self):
+        while True:
+            try:
+                with socket.create_connection((self.host, self.port), timeout=HEARTBEAT_SECONDS * 3) as sock:
+                    sock.sendall(_encode({'op': 'subscribe'}))
+                    with sock.makefile('rb') as f:
+                        for line in f:
+                            msg = json.loads(line)
+                            self._apply(msg['state'])
+                            if self.on_event:
+                                self.on_event(msg)
+            except (OSError, ValueError):
+                pass
+            time.sleep(1)
+
+    def _request(self, op):
+        reply = request(op, self.host, self.port)
+        if 'state' in reply:
+            self._apply(reply['state'])
+        return reply
+
+    def start(self):
+        self._request('start')
+
+    def stop(self):
+        self._request('stop')
+
+    def is_running(self):
+        return self.running
+
+    def get_app_exe_map(self):
+        try:
+            return self._request('exe_map')['exe_map']
+        except OSError:
+            return {}
+
+    def get_stats(self):
+        return self._request('stats')['stats']
+
+
+def connect_tracker(alert_callback=None, mode=None, host=DAEMON_HOST, port=DAEMON_PORT, spawn_daemon=True):
+    """Return the tracker a frontend should use.
+
+    In ``auto`` mode this is a RemoteTracker for the running daemon, starting one if
+    needed; alerts are then shown by the daemon. In ``off`` mode (or if the daemon
+    cannot be started) it is an in-process Tracker, as before. With spawn_daemon=False,
+    for callers that only read the state, None is returned instead of starting a daemon.
+    """
+    mode = mode or DAEMON_MODE
+    if mode != 'off':
+        running = is_running(host, port)
+        if not running and not spawn_daemon:
+            return None
+        spawned = not running and spawn(host, port)
+        if running or spawned:
+            try:
+                return RemoteTracker(host, port, spawned=spawned)
+            except (OSError, ValueError):
+                pass
+    return Tracker(alert_callback=alert_callback)
+
+
+def release_tracker(tracker):
+    """Stop tracking when a frontend exits: a daemon the frontend spawned is shut down, a
+    daemon that was already running is left to its other clients, and an in-process
+    tracker is stopped so its pending rows are written."""
+    if isinstance(tracker, RemoteTracker):
+        if tracker.spawned:
+            try:
+                request('shutdown', tracker.host, tracker.port)
+            except (OSError, ValueError):
+                pass
+    elif tracker is not None:
+        tracker.stop()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Run the tracker as a standalone daemon.')
+    parser.add_argument('--host', default=DAEMON_HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=DAEMON_PORT, help='port to listen on')
+    parser.add_argument('--db', default=database.DB_NAME, help='database file')
+    parser.add_argument('--start', action='store_true', help='start tracking immediately')
+    parser.add_argument('--poll-interval', type=float, default=1, help='seconds between samples')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    database.DB_NAME = args.db
+    database.init_db()
+    # Recover records a crashed tracker left in the event journal
+    journal.replay()
+    from notifier import show_alert
+    server = TrackerDaemon(args.host, args.port, alert_callback=show_alert, poll_interval=args.poll_interval)
+    if args.start:
+        server.tracker.start()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown_tracker()
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,161 @@
+import functools
+import heapq
+import itertools
+import os
 import sqlite3
-from datetime import datetime
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
+
+import metrics
+from categories import CATEGORIES, SYSTEM_PROCESSES, categorize, category_rules
+from normalize import normalize_title
+from utils import display_name
 
 DB_NAME = 'app_usage.db'
 
+# Strings repeated on every interval (app, window title, site, browser) are stored once in
+# these dimension tables; the fact tables usage_facts and website_facts only hold their
+# integer ids. usage_logs and website_usage_logs are views that join the strings back.
+DIMENSIONS = ('apps', 'titles', 'sites', 'browsers')
+DIM_CACHE_MAX = 100000  # per table; the cache is dropped and rebuilt when it grows past this
+_dim_cache = {}  # (DB_NAME, table) -> {string: id}
+# SQL list of SYSTEM_PROCESSES, for the rollup rebuild and the view triggers
+_SYSTEM_SQL = ', '.join(f"'{name}'" for name in sorted(SYSTEM_PROCESSES))
+
 def get_connection():
-    return sqlite3.connect(DB_NAME, isolation_level=None)
+    return sqlite3.connect(DB_NAME, isolation_level=None, factory=metrics.connection_factory())
+
+# Results of the report queries are memoized per (function, args, data version). The
+# version is the newest fact ids plus a "history" counter that the write path bumps
+# whenever it stores a row that starts before today. Reports that end before today only
+# change with the history counter, so they stay cached while the tracker keeps writing.
+QUERY_CACHE_BYTES = int(os.environ.get('APPUSAGE_QUERY_CACHE_MB', 32)) * 1024 * 1024
+
+class QueryCache:
+    """LRU of query results, bounded by an estimate of their size in bytes."""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # key -> (result, size)
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, result, size):
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+            self.entries[key] = (result, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self.entries), 'bytes': self.bytes, 'max_bytes': self.max_bytes}
+
+_query_cache = QueryCache(QUERY_CACHE_BYTES)
+
+def get_query_cache_stats():
+    return _query_cache.stats()
+
+def _result_bytes(rows):
+    # Estimated from up to ~256 evenly spaced rows, so large results are cheap to cache
+    sample = rows[::max(1, len(rows) // 256)]
+    per_row = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row) for row in sample)
+    return sys.getsizeof(rows) + per_row * len(rows) // max(1, len(sample))
+
+def _data_version():
+    conn = get_connection()
+    row = conn.execute('''
+        SELECT (SELECT MAX(id) FROM usage_facts), (SELECT MAX(id) FROM website_facts),
+               (SELECT version FROM data_versions WHERE name = 'history')
+    ''').fetchone()
+    conn.close()
+    return row
+
+def cached(last_day=None):
+    """Memoize a report query. last_day(*args) gives the last 'YYYY-MM-DD' the result
+    covers; without it the result is treated as covering today."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args):
+            usage_max, website_max, history = _data_version()
+            today = datetime.now().strftime('%Y-%m-%d')
+            if last_day is not None and last_day(*args) < today:
+                key = (DB_NAME, fn.__name__, args, history)
+            else:
+                # Results covering today also expire at midnight, even with no new rows
+                key = (DB_NAME, fn.__name__, args, history, usage_max, website_max, today)
+            result = _query_cache.get(key)
+            if result is None:
+                result = fn(*args)
+                _query_cache.put(key, result, _result_bytes(result))
+            # Callers get their own list; the cached rows are tuples and never change
+            return list(result)
+        return wrapper
+    return decorator
 
+@metrics.timed
 def init_db():
     conn = get_connection()
     c = conn.cursor()
     c.execute('PRAGMA journal_mode=WAL;')
+    for table in DIMENSIONS:
+        c.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            )
+        ''')
+    # Rows collected from other machines through /api/ingest carry their host and user;
+    # rows written by the local tracker leave them NULL.
     c.execute('''
-        CREATE TABLE IF NOT EXISTS usage_logs (
+        CREATE TABLE IF NOT EXISTS usage_facts (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
-            app_name TEXT,
-            title TEXT,
+            app_id INTEGER REFERENCES apps (id),
+            title_id INTEGER REFERENCES titles (id),
             start_time TEXT,
             end_time TEXT,
-            duration REAL
+            duration REAL,
+            host TEXT,
+            user TEXT
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS website_facts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            site_id INTEGER REFERENCES sites (id),
+            browser_id INTEGER REFERENCES browsers (id),
+            start_time TEXT,
+            end_time TEXT,
+            duration REAL,
+            host TEXT,
+            user TEXT
         )
     ''')
     c.execute('''
@@ -27,31 +165,733 @@ def init_db():
         )
     ''')
     c.execute('''
-        CREATE TABLE IF NOT EXISTS website_usage_logs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            site TEXT,
-            browser TEXT,
-            start_time TEXT,
-            end_time TEXT,
-            duration REAL
+        CREATE TABLE IF NOT EXISTS ingest_batches (
+            host TEXT NOT NULL,
+            user TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            received_at TEXT,
+            usage_rows INTEGER,
+            website_rows INTEGER,
+            PRIMARY KEY (host, user, seq)
+        )
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS data_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+    ''')
+    c.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('history', 0)")
+    # Highest event journal sequence folded into the database, per journal file
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS journal_checkpoints (
+            journal TEXT PRIMARY KEY,
+            seq INTEGER NOT NULL
+        )
+    ''')
+    # Running per-app and per-site totals kept by the write path, so "latest title",
+    # "top apps" and "all apps" are lookups instead of scans over all history
+    added = False
+    for table in ('apps', 'sites'):
+        added |= _add_column_if_missing(c, table, 'total_minutes', 'REAL NOT NULL DEFAULT 0')
+        added |= _add_column_if_missing(c, table, 'first_seen', 'TEXT')
+        added |= _add_column_if_missing(c, table, 'last_seen', 'TEXT')
+    added |= _add_column_if_missing(c, 'apps', 'latest_title_id', 'INTEGER REFERENCES titles (id)')
+    # Name each app is reported under, from its latest title (utils.display_name); NULL
+    # after a write through the usage_logs view until the next init_db
+    _add_column_if_missing(c, 'apps', 'display_name', 'TEXT')
+    # Category of each app and site, assigned when the write path first sees it (see
+    # categories.py) and changed with set_category; reports group by it in SQL
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS categories (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
         )
     ''')
+    c.executemany('INSERT OR IGNORE INTO categories (id, name) VALUES (?, ?)', list(enumerate(CATEGORIES, 1)))
+    for table in ('apps', 'sites'):
+        _add_column_if_missing(c, table, 'category_id', 'INTEGER REFERENCES categories (id)')
+    # categorize() as data, for the view triggers (see _category_sql); rewritten on every
+    # start so it follows the lists in categories.py
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS category_rules (
+            pattern TEXT NOT NULL,
+            exact INTEGER NOT NULL,
+            priority INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            PRIMARY KEY (priority, pattern)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('DELETE FROM category_rules')
+    c.executemany('INSERT OR IGNORE INTO category_rules (pattern, exact, priority, category_id) VALUES (?, ?, ?, ?)',
+                  [(pattern, exact, priority, CATEGORIES.index(category) + 1)
+                   for pattern, exact, priority, category in category_rules()])
+    c.execute('COMMIT')
+    # Id of the normalized form of each title (itself if already normalized); NULL until
+    # set by the write path or normalize_existing_titles()
+    _add_column_if_missing(c, 'titles', 'norm_id', 'INTEGER REFERENCES titles (id)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_titles_norm_id ON titles (norm_id)')
+    # Minutes per (hour, app) and (hour, site), and per day and month, kept by the write path for
+    # heatmaps and long ranges. hour counts hours and day days since 1970-01-01 00:00 in
+    # local (naive) time; an interval is attributed to the hour it starts in, like
+    # get_usage_by_hour. Reports read the coarsest rollup that has their buckets.
+    def missing(*tables):
+        return not all(c.execute('SELECT 1 FROM sqlite_master WHERE name = ?', (t,)).fetchone() for t in tables)
+    hourly_missing = missing('usage_hourly', 'usage_daily', 'website_daily', 'usage_monthly', 'website_monthly')
+    categories_missing = missing('category_hourly', 'category_daily')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usage_hourly (
+            hour INTEGER NOT NULL,
+            app_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (hour, app_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS website_hourly (
+            hour INTEGER NOT NULL,
+            site_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (hour, site_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usage_daily (
+            day INTEGER NOT NULL,
+            app_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (day, app_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS website_daily (
+            day INTEGER NOT NULL,
+            site_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (day, site_id)
+        ) WITHOUT ROWID
+    ''')
+    # Months since 1970-01 (see epoch_month), for totals over long ranges
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS usage_monthly (
+            month INTEGER NOT NULL,
+            app_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (month, app_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS website_monthly (
+            month INTEGER NOT NULL,
+            site_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (month, site_id)
+        ) WITHOUT ROWID
+    ''')
+    # Reported minutes (sites, and apps other than SYSTEM_PROCESSES) per (hour, category)
+    # and (day, category): at most one row per category and bucket whatever the number of
+    # apps, for heatmaps and chart series
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS category_hourly (
+            hour INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (hour, category_id)
+        ) WITHOUT ROWID
+    ''')
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS category_daily (
+            day INTEGER NOT NULL,
+            category_id INTEGER NOT NULL,
+            minutes REAL NOT NULL,
+            PRIMARY KEY (day, category_id)
+        ) WITHOUT ROWID
+    ''')
+    migrated = _migrate_legacy_logs(c)
+    if added or migrated:
+        rebuild_dimension_stats(c)
+    # Names added before categories existed, or through the usage_logs views, whose time
+    # is not in the category rollups yet
+    for table in ('apps', 'sites'):
+        uncategorized = c.execute(f'SELECT id, name FROM {table} WHERE category_id IS NULL').fetchall()
+        c.executemany(f'UPDATE {table} SET category_id = ? WHERE id = ?',
+                      [(_category_id(name), dim_id) for dim_id, name in uncategorized])
+        categories_missing |= bool(uncategorized)
+    if hourly_missing or migrated:
+        rebuild_hourly_aggregates(c)
+    elif categories_missing:
+        rebuild_category_rollups(c)
+    _refresh_display_names(c, missing_only=True)
+    c.execute('BEGIN IMMEDIATE')
+    _link_new_titles(c)
+    c.execute('COMMIT')
+    c.execute('''
+        CREATE VIEW IF NOT EXISTS usage_logs AS
+        SELECT f.id, a.name AS app_name, t.name AS title, f.start_time, f.end_time, f.duration, f.host, f.user
+        FROM usage_facts f
+        LEFT JOIN apps a ON a.id = f.app_id
+        LEFT JOIN titles t ON t.id = f.title_id
+    ''')
+    c.execute('''
+        CREATE VIEW IF NOT EXISTS website_usage_logs AS
+        SELECT f.id, s.name AS site, b.name AS browser, f.start_time, f.end_time, f.duration, f.host, f.user
+        FROM website_facts f
+        LEFT JOIN sites s ON s.id = f.site_id
+        LEFT JOIN browsers b ON b.id = f.browser_id
+    ''')
+    # Keep plain INSERTs into the old table names working. Triggers are recreated on
+    # every start so their bodies follow schema changes. Titles cannot be normalized in
+    # SQL, so the usage trigger leaves titles.norm_id NULL; the next write_usage_rows or
+    # init_db sets it (_link_new_titles), and title reports fall back to the raw title
+    # until then.
+    c.execute('DROP TRIGGER IF EXISTS usage_logs_insert')
+    c.execute(f'''
+        CREATE TRIGGER usage_logs_insert INSTEAD OF INSERT ON usage_logs
+        BEGIN
+            INSERT OR IGNORE INTO apps (name, category_id) VALUES (NEW.app_name, {_category_sql('NEW.app_name')});
+            INSERT OR IGNORE INTO titles (name) VALUES (NEW.title);
+            INSERT INTO usage_facts (app_id, title_id, start_time, end_time, duration, host, user)
+            VALUES ((SELECT id FROM apps WHERE name = NEW.app_name), (SELECT id FROM titles WHERE name = NEW.title),
+                    NEW.start_time, NEW.end_time, NEW.duration, NEW.host, NEW.user);
+            UPDATE apps SET
+                total_minutes = total_minutes + coalesce(NEW.duration, 0),
+                first_seen = coalesce(min(first_seen, NEW.start_time), first_seen, NEW.start_time),
+                last_seen = coalesce(max(last_seen, NEW.end_time), last_seen, NEW.end_time),
+                latest_title_id = (SELECT id FROM titles WHERE name = NEW.title),
+                display_name = NULL
+            WHERE name = NEW.app_name;
+{_rollup_trigger_sql('usage', 'apps', 'app_id', 'NEW.app_name')}
+            UPDATE data_versions SET version = version + 1
+            WHERE name = 'history' AND NEW.start_time < date('now', 'localtime');
+        END
+    ''')
+    c.execute('DROP TRIGGER IF EXISTS website_usage_logs_insert')
+    c.execute(f'''
+        CREATE TRIGGER website_usage_logs_insert INSTEAD OF INSERT ON website_usage_logs
+        BEGIN
+            INSERT OR IGNORE INTO sites (name, category_id) VALUES (NEW.site, {_category_sql('NEW.site')});
+            INSERT OR IGNORE INTO browsers (name) VALUES (NEW.browser);
+            INSERT INTO website_facts (site_id, browser_id, start_time, end_time, duration, host, user)
+            VALUES ((SELECT id FROM sites WHERE name = NEW.site), (SELECT id FROM browsers WHERE name = NEW.browser),
+                    NEW.start_time, NEW.end_time, NEW.duration, NEW.host, NEW.user);
+            UPDATE sites SET
+                total_minutes = total_minutes + coalesce(NEW.duration, 0),
+                first_seen = coalesce(min(first_seen, NEW.start_time), first_seen, NEW.start_time),
+                last_seen = coalesce(max(last_seen, NEW.end_time), last_seen, NEW.end_time)
+            WHERE name = NEW.site;
+{_rollup_trigger_sql('website', 'sites', 'site_id', 'NEW.site')}
+            UPDATE data_versions SET version = version + 1
+            WHERE name = 'history' AND NEW.start_time < date('now', 'localtime');
+        END
+    ''')
+    for table in ('usage_facts', 'website_facts'):
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_host_user ON {table} (host, user)')
+    # Title search: FTS5 over the titles dimension, then facts by title via this index
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_facts_title_start ON usage_facts (title_id, start_time)')
+    # Time-ordered scans (analytics) read this index instead of sorting the range
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_facts_start ON usage_facts (start_time)')
+    # Keyset pages of raw rows (/api/logs), overall and for one app or site
+    c.execute('CREATE INDEX IF NOT EXISTS idx_website_facts_start ON website_facts (start_time)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_usage_facts_app_start ON usage_facts (app_id, start_time)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_website_facts_site_start ON website_facts (site_id, start_time)')
+    _create_title_search(c)
     conn.commit()
     conn.close()
+    _forget_dim_cache()
+    _query_cache.clear()
 
-def insert_usage_log(app_name, title, start_time, end_time, duration):
+def _create_title_search(c):
+    """External-content FTS5 index on titles, kept in sync by triggers. Skipped (and
+    search_titles falls back to LIKE) if this SQLite was built without FTS5."""
+    if not c.execute("SELECT 1 FROM sqlite_master WHERE name = 'titles_fts'").fetchone():
+        try:
+            c.execute("CREATE VIRTUAL TABLE titles_fts USING fts5(name, content='titles', content_rowid='id')")
+        except sqlite3.OperationalError:
+            return
+        c.execute("INSERT INTO titles_fts (titles_fts) VALUES ('rebuild')")
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS titles_fts_insert AFTER INSERT ON titles
+        BEGIN
+            INSERT INTO titles_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS titles_fts_delete AFTER DELETE ON titles
+        BEGIN
+            INSERT INTO titles_fts (titles_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS titles_fts_update AFTER UPDATE OF name ON titles
+        BEGIN
+            INSERT INTO titles_fts (titles_fts, rowid, name) VALUES ('delete', OLD.id, OLD.name);
+            INSERT INTO titles_fts (rowid, name) VALUES (NEW.id, NEW.name);
+        END
+    ''')
+
+def _add_column_if_missing(c, table, column, decl):
+    columns = [row[1] for row in c.execute(f'PRAGMA table_info({table})')]
+    if column not in columns:
+        c.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+        return True
+    return False
+
+def rebuild_dimension_stats(c):
+    """Recompute the running totals on apps and sites from the fact tables."""
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('DROP TABLE IF EXISTS temp.dim_stats')
+    c.execute('''
+        CREATE TEMP TABLE dim_stats (id INTEGER PRIMARY KEY, total REAL, first_seen TEXT, last_seen TEXT, latest_fact INTEGER)
+    ''')
+    c.execute('''
+        INSERT INTO dim_stats
+        SELECT app_id, SUM(duration), MIN(start_time), MAX(end_time), MAX(id) FROM usage_facts
+        WHERE app_id IS NOT NULL GROUP BY app_id
+    ''')
+    c.execute('''
+        UPDATE apps SET
+            total_minutes = coalesce((SELECT total FROM dim_stats s WHERE s.id = apps.id), 0),
+            first_seen = (SELECT first_seen FROM dim_stats s WHERE s.id = apps.id),
+            last_seen = (SELECT last_seen FROM dim_stats s WHERE s.id = apps.id),
+            latest_title_id = (SELECT f.title_id FROM dim_stats s JOIN usage_facts f ON f.id = s.latest_fact WHERE s.id = apps.id)
+    ''')
+    _refresh_display_names(c)
+    c.execute('DELETE FROM dim_stats')
+    c.execute('''
+        INSERT INTO dim_stats
+        SELECT site_id, SUM(duration), MIN(start_time), MAX(end_time), MAX(id) FROM website_facts
+        WHERE site_id IS NOT NULL GROUP BY site_id
+    ''')
+    c.execute('''
+        UPDATE sites SET
+            total_minutes = coalesce((SELECT total FROM dim_stats s WHERE s.id = sites.id), 0),
+            first_seen = (SELECT first_seen FROM dim_stats s WHERE s.id = sites.id),
+            last_seen = (SELECT last_seen FROM dim_stats s WHERE s.id = sites.id)
+    ''')
+    c.execute('DROP TABLE temp.dim_stats')
+    c.execute('COMMIT')
+
+def _refresh_display_names(c, missing_only=False):
+    """Recompute apps.display_name from each app's name and latest title."""
+    rows = c.execute(f'''
+        SELECT a.id, a.name, t.name FROM apps a LEFT JOIN titles t ON t.id = a.latest_title_id
+        {'WHERE a.display_name IS NULL' if missing_only else ''}
+    ''').fetchall()
+    c.executemany('UPDATE apps SET display_name = ? WHERE id = ?',
+                  [(display_name(name, title), app_id) for app_id, name, title in rows])
+
+# (time column, table suffix, bucket of NEW.start_time) of the rollups kept by the view
+# triggers; months count from 1970-01 like epoch_month
+_TRIGGER_BUCKETS = (
+    ('hour', 'hourly', "CAST(strftime('%s', NEW.start_time) AS INTEGER) / 3600"),
+    ('day', 'daily', "CAST(strftime('%s', NEW.start_time) AS INTEGER) / 86400"),
+    ('month', 'monthly', "(CAST(strftime('%Y', NEW.start_time) AS INTEGER) - 1970) * 12"
+                         " + CAST(strftime('%m', NEW.start_time) AS INTEGER) - 1"),
+)
+
+def _rollup_trigger_sql(prefix, dimension, column, name):
+    """Trigger statements adding NEW.duration to the hourly, daily and monthly rollups of
+    the app or site called name, and to the category ones."""
+    reported = f" AND lower(name) NOT IN ({_SYSTEM_SQL})" if dimension == 'apps' else ''
+    rollups = []
+    for bucket, suffix, at in _TRIGGER_BUCKETS:
+        rollups.append((bucket, at, f'{prefix}_{suffix}', column, 'id', ''))
+        if suffix != 'monthly':
+            rollups.append((bucket, at, f'category_{suffix}', 'category_id', 'category_id',
+                            f' AND category_id IS NOT NULL{reported}'))
+    statements = []
+    for bucket, at, table, key, value, where in rollups:
+        statements.append(f'''
+            INSERT OR IGNORE INTO {table} ({bucket}, {key}, minutes)
+            SELECT {at}, {value}, 0 FROM {dimension}
+            WHERE name = {name}{where} AND strftime('%s', NEW.start_time) IS NOT NULL;
+            UPDATE {table} SET minutes = minutes + coalesce(NEW.duration, 0)
+            WHERE {bucket} = {at}
+              AND {key} = (SELECT {value} FROM {dimension} WHERE name = {name}{where});''')
+    return ''.join(statements).strip('\n')
+
+def rebuild_hourly_aggregates(c):
+    """Recompute the hourly, daily and monthly rollups from the fact tables, then the
+    category rollups from them."""
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('DELETE FROM usage_hourly')
+    c.execute('''
+        INSERT INTO usage_hourly (hour, app_id, minutes)
+        SELECT CAST(strftime('%s', start_time) AS INTEGER) / 3600 AS hour, app_id, SUM(duration) FROM usage_facts
+        WHERE app_id IS NOT NULL AND strftime('%s', start_time) IS NOT NULL
+        GROUP BY hour, app_id
+    ''')
+    c.execute('DELETE FROM website_hourly')
+    c.execute('''
+        INSERT INTO website_hourly (hour, site_id, minutes)
+        SELECT CAST(strftime('%s', start_time) AS INTEGER) / 3600 AS hour, site_id, SUM(duration) FROM website_facts
+        WHERE site_id IS NOT NULL AND strftime('%s', start_time) IS NOT NULL
+        GROUP BY hour, site_id
+    ''')
+    c.execute('DELETE FROM usage_daily')
+    c.execute('INSERT INTO usage_daily (day, app_id, minutes) SELECT hour / 24 AS day, app_id, SUM(minutes) FROM usage_hourly GROUP BY day, app_id')
+    c.execute('DELETE FROM website_daily')
+    c.execute('INSERT INTO website_daily (day, site_id, minutes) SELECT hour / 24 AS day, site_id, SUM(minutes) FROM website_hourly GROUP BY day, site_id')
+    for prefix, column in (('usage', 'app_id'), ('website', 'site_id')):
+        c.execute(f'DELETE FROM {prefix}_monthly')
+        c.execute(f'''
+            INSERT INTO {prefix}_monthly (month, {column}, minutes)
+            SELECT (CAST(strftime('%Y', day * 86400, 'unixepoch') AS INTEGER) - 1970) * 12
+                   + CAST(strftime('%m', day * 86400, 'unixepoch') AS INTEGER) - 1 AS month,
+                   {column}, SUM(minutes)
+            FROM {prefix}_daily GROUP BY month, {column}
+        ''')
+    c.execute('COMMIT')
+    rebuild_category_rollups(c)
+
+def rebuild_category_rollups(c):
+    """Recompute category_hourly and category_daily from usage_hourly, website_hourly and
+    the stored categories."""
+    c.execute('BEGIN IMMEDIATE')
+    c.execute('DELETE FROM category_hourly')
+    c.execute(f'''
+        INSERT INTO category_hourly (hour, category_id, minutes)
+        SELECT hour, category_id, SUM(minutes) FROM (
+            SELECT h.hour, a.category_id, h.minutes FROM usage_hourly h JOIN apps a ON a.id = h.app_id
+            WHERE lower(a.name) NOT IN ({_SYSTEM_SQL})
+            UNION ALL
+            SELECT h.hour, s.category_id, h.minutes FROM website_hourly h JOIN sites s ON s.id = h.site_id
+        ) WHERE category_id IS NOT NULL
+        GROUP BY hour, category_id
+    ''')
+    c.execute('DELETE FROM category_daily')
+    c.execute('''
+        INSERT INTO category_daily (day, category_id, minutes)
+        SELECT hour / 24 AS day, category_id, SUM(minutes) FROM category_hourly GROUP BY day, category_id
+    ''')
+    c.execute('COMMIT')
+
+def _migrate_legacy_logs(c):
+    """Move rows from the old string-per-row usage_logs/website_usage_logs tables into
+    the dimension and fact tables, keeping their ids, then drop the old tables."""
+    legacy = {row[0] for row in c.execute('''
+        SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ('usage_logs', 'website_usage_logs')
+    ''')}
+    if not legacy:
+        return False
+    c.execute('BEGIN IMMEDIATE')
+    if 'usage_logs' in legacy:
+        _add_column_if_missing(c, 'usage_logs', 'host', 'TEXT')
+        _add_column_if_missing(c, 'usage_logs', 'user', 'TEXT')
+        c.execute('INSERT OR IGNORE INTO apps (name) SELECT DISTINCT app_name FROM usage_logs WHERE app_name IS NOT NULL')
+        c.execute('INSERT OR IGNORE INTO titles (name) SELECT DISTINCT title FROM usage_logs WHERE title IS NOT NULL')
+        c.execute('''
+            INSERT INTO usage_facts (id, app_id, title_id, start_time, end_time, duration, host, user)
+            SELECT l.rowid, a.id, t.id, l.start_time, l.end_time, l.duration, l.host, l.user
+            FROM usage_logs l
+            LEFT JOIN apps a ON a.name = l.app_name
+            LEFT JOIN titles t ON t.name = l.title
+        ''')
+        c.execute('DROP TABLE usage_logs')
+    if 'website_usage_logs' in legacy:
+        _add_column_if_missing(c, 'website_usage_logs', 'host', 'TEXT')
+        _add_column_if_missing(c, 'website_usage_logs', 'user', 'TEXT')
+        c.execute('INSERT OR IGNORE INTO sites (name) SELECT DISTINCT site FROM website_usage_logs WHERE site IS NOT NULL')
+        c.execute('INSERT OR IGNORE INTO browsers (name) SELECT DISTINCT browser FROM website_usage_logs WHERE browser IS NOT NULL')
+        c.execute('''
+            INSERT INTO website_facts (id, site_id, browser_id, start_time, end_time, duration, host, user)
+            SELECT l.rowid, s.id, b.id, l.start_time, l.end_time, l.duration, l.host, l.user
+            FROM website_usage_logs l
+            LEFT JOIN sites s ON s.name = l.site
+            LEFT JOIN browsers b ON b.name = l.browser
+        ''')
+        c.execute('DROP TABLE website_usage_logs')
+    c.execute('COMMIT')
+    return True
+
+def _forget_dim_cache():
+    for key in [key for key in _dim_cache if key[0] == DB_NAME]:
+        del _dim_cache[key]
+
+def _category_sql(name):
+    """SQL for the category id categorize() gives name, from category_rules."""
+    return f'''coalesce((
+                SELECT category_id FROM category_rules
+                WHERE CASE WHEN exact THEN pattern = {name} ELSE instr(lower({name}), pattern) > 0 END
+                ORDER BY priority LIMIT 1
+            ), {CATEGORIES.index('Others') + 1})'''
+
+def _category_id(name):
+    # categories rows are CATEGORIES in order, from id 1
+    return CATEGORIES.index(categorize(name)) + 1
+
+def _dim_id(c, table, value):
+    """Integer id of a string in a dimension table, adding it on first sight."""
+    if value is None:
+        return None
+    cache = _dim_cache.setdefault((DB_NAME, table), {})
+    dim_id = cache.get(value)
+    if dim_id is None:
+        if table in ('apps', 'sites'):
+            c.execute(f'INSERT OR IGNORE INTO {table} (name, category_id) VALUES (?, ?)', (value, _category_id(value)))
+        else:
+            c.execute(f'INSERT OR IGNORE INTO {table} (name) VALUES (?)', (value,))
+        dim_id = c.execute(f'SELECT id FROM {table} WHERE name = ?', (value,)).fetchone()[0]
+        if len(cache) >= DIM_CACHE_MAX:
+            cache.clear()
+        cache[value] = dim_id
+    return dim_id
+
+def _set_norm_ids(c, title_ids):
+    """Point titles.norm_id at the normalized form of each {title: id}, once per title."""
+    cache = _dim_cache.setdefault((DB_NAME, 'norm_ids'), {})
+    for title, title_id in title_ids.items():
+        if title_id in cache:
+            continue
+        norm = normalize_title(title)
+        norm_id = title_id if norm == title else _dim_id(c, 'titles', norm)
+        c.execute('UPDATE titles SET norm_id = ? WHERE id = ? AND norm_id IS NULL', (norm_id, title_id))
+        # normalize_title is idempotent, so the normalized title is its own norm
+        c.execute('UPDATE titles SET norm_id = id WHERE id = ? AND norm_id IS NULL', (norm_id,))
+        if len(cache) >= DIM_CACHE_MAX:
+            cache.clear()
+        cache[title_id] = norm_id
+
+def _link_new_titles(c):
+    """Set norm_id of the titles added without one, through the usage_logs view."""
+    rows = c.execute('SELECT id, name FROM titles WHERE norm_id IS NULL').fetchall()
+    # Whatever _set_norm_ids remembers about these ids is stale
+    cache = _dim_cache.get((DB_NAME, 'norm_ids'), {})
+    for title_id, _ in rows:
+        cache.pop(title_id, None)
+    _set_norm_ids(c, {name: title_id for title_id, name in rows})
+
+def _fold_stats(params):
+    """Per-dimension [minutes, first start, last end, last second id] for a batch of fact rows."""
+    stats = {}
+    for dim_id, other_id, start_time, end_time, duration, _, _ in params:
+        if dim_id is None:
+            continue
+        s = stats.get(dim_id)
+        if s is None:
+            stats[dim_id] = [duration or 0, start_time, end_time, other_id]
+            continue
+        s[0] += duration or 0
+        if start_time is not None and (s[1] is None or start_time < s[1]):
+            s[1] = start_time
+        if end_time is not None and (s[2] is None or end_time > s[2]):
+            s[2] = end_time
+        s[3] = other_id
+    return stats
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+@functools.lru_cache(maxsize=4096)
+def epoch_hour(timestamp):
+    """Hours since 1970-01-01 00:00 for a 'YYYY-MM-DD HH...' timestamp (None if malformed)."""
+    try:
+        return (date.fromisoformat(timestamp[:10]).toordinal() - _EPOCH_ORDINAL) * 24 + int(timestamp[11:13])
+    except (TypeError, ValueError):
+        return None
+
+def _add_minutes(c, table, bucket, column, totals):
+    """Add {(bucket, key): minutes} to a rollup table keyed by (bucket, column)."""
+    c.executemany(f'INSERT OR IGNORE INTO {table} ({bucket}, {column}, minutes) VALUES (?, ?, 0)', list(totals))
+    c.executemany(f'UPDATE {table} SET minutes = minutes + ? WHERE {bucket} = ? AND {column} = ?',
+                  [(minutes, at, key) for (at, key), minutes in totals.items()])
+
+def epoch_month(day):
+    """Months since 1970-01 of the month containing a day counted since 1970-01-01."""
+    d = date.fromordinal(_EPOCH_ORDINAL + day)
+    return (d.year - 1970) * 12 + d.month - 1
+
+def _month_first_day(month):
+    """Days since 1970-01-01 of the first day of a month counted since 1970-01."""
+    return date(1970 + month // 12, month % 12 + 1, 1).toordinal() - _EPOCH_ORDINAL
+
+def _regroup(totals, bucket_of):
+    """{(bucket, key): minutes} summed into {(bucket_of(bucket), key): minutes}."""
+    grouped = {}
+    for (at, key), minutes in totals.items():
+        grouped[(bucket_of(at), key)] = grouped.get((bucket_of(at), key), 0) + minutes
+    return grouped
+
+def _reported_categories(c, dimension, ids):
+    """{id: category_id} of the given apps or sites whose time is reported."""
+    ids = list(ids)
+    rows = c.execute(f'SELECT id, name, category_id FROM {dimension} WHERE id IN ({", ".join("?" * len(ids))})',
+                     ids).fetchall()
+    return {dim_id: category_id for dim_id, name, category_id in rows
+            if category_id is not None and not (dimension == 'apps' and name.lower() in SYSTEM_PROCESSES)}
+
+def _add_rollups(c, prefix, column, dimension, params):
+    """Fold a batch of fact rows into the usage_* or website_* rollups and the category ones."""
+    totals = {}
+    for dim_id, _, start_time, _, duration, _, _ in params:
+        hour = epoch_hour(start_time[:13]) if start_time else None
+        if dim_id is None or hour is None:
+            continue
+        totals[(hour, dim_id)] = totals.get((hour, dim_id), 0) + (duration or 0)
+    _add_minutes(c, f'{prefix}_hourly', 'hour', column, totals)
+    daily = _regroup(totals, lambda hour: hour // 24)
+    _add_minutes(c, f'{prefix}_daily', 'day', column, daily)
+    _add_minutes(c, f'{prefix}_monthly', 'month', column, _regroup(daily, epoch_month))
+    # Categories are read in the transaction: set_category may run in another process
+    categories = _reported_categories(c, dimension, {dim_id for _, dim_id in totals})
+    by_category = {}
+    for (hour, dim_id), minutes in totals.items():
+        category_id = categories.get(dim_id)
+        if category_id is not None:
+            by_category[(hour, category_id)] = by_category.get((hour, category_id), 0) + minutes
+    _add_minutes(c, 'category_hourly', 'hour', 'category_id', by_category)
+    _add_minutes(c, 'category_daily', 'day', 'category_id', _regroup(by_category, lambda hour: hour // 24))
+
+def _note_history(c, params):
+    """Bump the history version if any row starts before today (see QueryCache)."""
+    today = datetime.now().strftime('%Y-%m-%d')
+    if any(p[2] is not None and p[2] < today for p in params):
+        c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'history'")
+
+def write_usage_rows(c, rows):
+    """Insert (app_name, title, start_time, end_time, duration, host, user) rows on cursor c
+    and fold them into the per-app totals.
+
+    The caller owns the transaction; if it rolls back it must call _forget_dim_cache().
+    """
+    params = [(_dim_id(c, 'apps', r[0]), _dim_id(c, 'titles', r[1])) + tuple(r[2:]) for r in rows]
+    # Titles are stored as written; title-level reports group them by norm_id
+    _set_norm_ids(c, {r[1]: p[1] for p, r in zip(params, rows) if r[1] is not None})
+    _link_new_titles(c)
+    latest = {p[0]: r for p, r in zip(params, rows)}
+    c.executemany('''
+        INSERT INTO usage_facts (app_id, title_id, start_time, end_time, duration, host, user)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', params)
+    c.executemany('''
+        UPDATE apps SET
+            total_minutes = total_minutes + ?,
+            first_seen = coalesce(min(first_seen, ?), first_seen, ?),
+            last_seen = coalesce(max(last_seen, ?), last_seen, ?),
+            latest_title_id = ?,
+            display_name = ?
+        WHERE id = ?
+    ''', [(total, first, first, last, last, title_id, display_name(*latest[app_id][:2]), app_id)
+          for app_id, (total, first, last, title_id) in _fold_stats(params).items()])
+    _add_rollups(c, 'usage', 'app_id', 'apps', params)
+    _note_history(c, params)
+
+def write_website_rows(c, rows):
+    """Insert (site, browser, start_time, end_time, duration, host, user) rows on cursor c
+    and fold them into the per-site totals."""
+    params = [(_dim_id(c, 'sites', r[0]), _dim_id(c, 'browsers', r[1])) + tuple(r[2:]) for r in rows]
+    c.executemany('''
+        INSERT INTO website_facts (site_id, browser_id, start_time, end_time, duration, host, user)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', params)
+    c.executemany('''
+        UPDATE sites SET
+            total_minutes = total_minutes + ?,
+            first_seen = coalesce(min(first_seen, ?), first_seen, ?),
+            last_seen = coalesce(max(last_seen, ?), last_seen, ?)
+        WHERE id = ?
+    ''', [(total, first, first, last, last, site_id) for site_id, (total, first, last, _) in _fold_stats(params).items()])
+    _add_rollups(c, 'website', 'site_id', 'sites', params)
+    _note_history(c, params)
+
+def _write(usage_rows=(), website_rows=()):
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        INSERT INTO usage_logs (app_name, title, start_time, end_time, duration)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (app_name, title, start_time, end_time, duration))
-    conn.commit()
-    conn.close()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        write_usage_rows(c, usage_rows)
+        write_website_rows(c, website_rows)
+        c.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        _forget_dim_cache()
+        raise
+    finally:
+        conn.close()
+
+@metrics.timed
+def ingest_batch(host, user, seq, usage_rows, website_rows):
+    """Apply one client batch in a single transaction.
+
+    usage_rows are (app_name, title, start_time, end_time, duration) tuples and website_rows
+    (site, browser, start_time, end_time, duration). A batch is identified by
+    (host, user, seq); replaying one that was already applied changes nothing and
+    returns False.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        try:
+            c.execute('''
+                INSERT INTO ingest_batches (host, user, seq, received_at, usage_rows, website_rows)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (host, user, seq, datetime.now().strftime('%Y-%m-%d %H:%M:%S'), len(usage_rows), len(website_rows)))
+        except sqlite3.IntegrityError:
+            c.execute('ROLLBACK')
+            return False
+        write_usage_rows(c, [row + (host, user) for row in usage_rows])
+        write_website_rows(c, [row + (host, user) for row in website_rows])
+        c.execute('COMMIT')
+        return True
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        _forget_dim_cache()
+        raise
+    finally:
+        conn.close()
+
+@metrics.timed
+def ingest_journal(journal, records):
+    """Fold event journal records into the database in one transaction.
+
+    records are (seq, kind, row) in journal order, with kind 'usage' or 'website' and row
+    a 7-tuple as for write_usage_rows. A record is applied only if its seq is above both
+    the journal's checkpoint and every record before it in the batch: lower ones were
+    applied by an earlier call, or are stale copies left by a truncation cut short by a
+    crash, so replaying a journal after a crash is safe. Returns the number of records
+    applied.
+    """
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        c.execute('SELECT seq FROM journal_checkpoints WHERE journal = ?', (journal,))
+        row = c.fetchone()
+        done = row[0] if row else 0
+        fresh = []
+        for record in records:
+            if record[0] > done:
+                fresh.append(record)
+                done = record[0]
+        write_usage_rows(c, [row for _, kind, row in fresh if kind == 'usage'])
+        write_website_rows(c, [row for _, kind, row in fresh if kind == 'website'])
+        if fresh:
+            c.execute('INSERT OR REPLACE INTO journal_checkpoints (journal, seq) VALUES (?, ?)',
+                      (journal, done))
+        c.execute('COMMIT')
+        return len(fresh)
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        _forget_dim_cache()
+        raise
+    finally:
+        conn.close()
+
+@metrics.timed
+def insert_usage_log(app_name, title, start_time, end_time, duration):
+    _write(usage_rows=[(app_name, title, start_time, end_time, duration, None, None)])
 
+def limit_name(app_name):
+    """Key of an app in the limits table."""
+    return app_name.lower().replace('.exe', '')
+
+@metrics.timed
 def set_limit(app_name, max_minutes):
-    # Normalize app_name for storage
-    norm_app_name = app_name.lower().replace('.exe', '')
+    norm_app_name = limit_name(app_name)
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
@@ -61,9 +901,9 @@ def set_limit(app_name, max_minutes):
     conn.commit()
     conn.close()
 
+@metrics.timed
 def get_limit(app_name):
-    # Normalize app_name for lookup
-    norm_app_name = app_name.lower().replace('.exe', '')
+    norm_app_name = limit_name(app_name)
     conn = get_connection()
     c = conn.cursor()
     c.execute('SELECT max_minutes FROM limits WHERE app_name=?', (norm_app_name,))
@@ -71,187 +911,678 @@ def get_limit(app_name):
     conn.close()
     return row[0] if row else None
 
+@metrics.timed
+def get_limits():
+    """{limit_name: max_minutes} for every app with a limit."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT app_name, max_minutes FROM limits')
+    limits = dict(c.fetchall())
+    conn.close()
+    return limits
+
+# The queries below group on integer ids in the fact tables and only join the name
+# strings onto the (much smaller) grouped result.
+
+@metrics.timed
+@cached()
 def get_usage_today():
     conn = get_connection()
     c = conn.cursor()
     today = datetime.now().strftime('%Y-%m-%d')
     c.execute('''
-        SELECT app_name, SUM(duration) FROM usage_logs
-        WHERE start_time LIKE ?
-        GROUP BY app_name
-        ORDER BY SUM(duration) DESC
+        SELECT a.name, s.total FROM (
+            SELECT app_id, SUM(duration) AS total FROM usage_facts
+            WHERE start_time LIKE ?
+            GROUP BY app_id
+        ) s LEFT JOIN apps a ON a.id = s.app_id
+        ORDER BY s.total DESC
     ''', (today+'%',))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
 def get_top_used_apps(limit=5):
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        SELECT app_name, SUM(duration) as total FROM usage_logs
-        GROUP BY app_name
-        ORDER BY total DESC
-        LIMIT ?
-    ''', (limit,))
+    c.execute('SELECT name, total_minutes FROM apps ORDER BY total_minutes DESC LIMIT ?', (limit,))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
 def get_latest_window_titles():
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        SELECT app_name, title FROM usage_logs
-        WHERE id IN (
-            SELECT MAX(id) FROM usage_logs GROUP BY app_name
-        )
-    ''')
+    c.execute('SELECT a.name, t.name FROM apps a LEFT JOIN titles t ON t.id = a.latest_title_id')
     results = dict(c.fetchall())
     conn.close()
     return results
 
-def log_website_usage(site, browser, start_time, end_time, duration):
+@metrics.timed
+def get_display_names():
+    """{app_name: display name} for every app, as stored by the write path."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        INSERT INTO website_usage_logs (site, browser, start_time, end_time, duration)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (site, browser, start_time, end_time, duration))
-    conn.commit()
+        SELECT a.name, a.display_name, t.name FROM apps a
+        LEFT JOIN titles t ON t.id = a.latest_title_id
+    ''')
+    results = {name: shown or display_name(name, title) for name, shown, title in c.fetchall()}
     conn.close()
+    return results
+
+@metrics.timed
+def get_app_names():
+    """Every app that has ever been logged."""
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute('SELECT name FROM apps')
+    results = [row[0] for row in c.fetchall()]
+    conn.close()
+    return results
 
+@metrics.timed
+def log_website_usage(site, browser, start_time, end_time, duration):
+    _write(website_rows=[(site, browser, start_time, end_time, duration, None, None)])
+
+@metrics.timed
+@cached()
 def get_website_usage_today():
     conn = get_connection()
     c = conn.cursor()
     today = datetime.now().strftime('%Y-%m-%d')
     c.execute('''
-        SELECT site, SUM(duration) FROM website_usage_logs
-        WHERE start_time LIKE ?
-        GROUP BY site
-        ORDER BY SUM(duration) DESC
+        SELECT w.name, s.total FROM (
+            SELECT site_id, SUM(duration) AS total FROM website_facts
+            WHERE start_time LIKE ?
+            GROUP BY site_id
+        ) s LEFT JOIN sites w ON w.id = s.site_id
+        ORDER BY s.total DESC
     ''', (today+'%',))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
 def get_top_websites(limit=10):
     conn = get_connection()
     c = conn.cursor()
-    c.execute('''
-        SELECT site, SUM(duration) as total FROM website_usage_logs
-        GROUP BY site
-        ORDER BY total DESC
-        LIMIT ?
-    ''', (limit,))
+    c.execute('SELECT name, total_minutes FROM sites ORDER BY total_minutes DESC LIMIT ?', (limit,))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
 def get_usage_range(start_date, end_date):
     """Get app usage between two dates (inclusive), grouped by app and day."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT app_name, start_time, SUM(duration) FROM usage_logs
-        WHERE date(start_time) BETWEEN ? AND ?
-        GROUP BY app_name, date(start_time)
-        ORDER BY date(start_time), SUM(duration) DESC
+        SELECT a.name, s.start_time, s.total FROM (
+            SELECT app_id, start_time, date(start_time) AS day, SUM(duration) AS total FROM usage_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY app_id, day
+        ) s LEFT JOIN apps a ON a.id = s.app_id
+        ORDER BY s.day, s.total DESC
     ''', (start_date, end_date))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda date_str: date_str)
 def get_usage_by_hour(date_str):
     """Get app usage for a specific date, grouped by hour."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT strftime('%H', start_time) as hour, app_name, SUM(duration) FROM usage_logs
-        WHERE date(start_time) = ?
-        GROUP BY hour, app_name
-        ORDER BY hour, SUM(duration) DESC
+        SELECT s.hour, a.name, s.total FROM (
+            SELECT strftime('%H', start_time) AS hour, app_id, SUM(duration) AS total FROM usage_facts
+            WHERE date(start_time) = ?
+            GROUP BY hour, app_id
+        ) s LEFT JOIN apps a ON a.id = s.app_id
+        ORDER BY s.hour, s.total DESC
     ''', (date_str,))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
 def get_usage_by_day(start_date, end_date):
     """Get total app usage per day in a date range."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT date(start_time) as day, app_name, SUM(duration) FROM usage_logs
-        WHERE date(start_time) BETWEEN ? AND ?
-        GROUP BY day, app_name
-        ORDER BY day, SUM(duration) DESC
+        SELECT s.day, a.name, s.total FROM (
+            SELECT date(start_time) AS day, app_id, SUM(duration) AS total FROM usage_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY day, app_id
+        ) s LEFT JOIN apps a ON a.id = s.app_id
+        ORDER BY s.day, s.total DESC
     ''', (start_date, end_date))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
 def get_usage_by_week(start_date, end_date):
     """Get total app usage per week in a date range."""
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT strftime('%Y-%W', start_time) as week, app_name, SUM(duration) FROM usage_logs
-        WHERE date(start_time) BETWEEN ? AND ?
-        GROUP BY week, app_name
-        ORDER BY week, SUM(duration) DESC
+        SELECT s.week, a.name, s.total FROM (
+            SELECT strftime('%Y-%W', start_time) AS week, app_id, SUM(duration) AS total FROM usage_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY week, app_id
+        ) s LEFT JOIN apps a ON a.id = s.app_id
+        ORDER BY s.week, s.total DESC
     ''', (start_date, end_date))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
 def get_website_usage_range(start_date, end_date):
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT site, start_time, SUM(duration) FROM website_usage_logs
-        WHERE date(start_time) BETWEEN ? AND ?
-        GROUP BY site, date(start_time)
-        ORDER BY date(start_time), SUM(duration) DESC
+        SELECT w.name, s.start_time, s.total FROM (
+            SELECT site_id, start_time, date(start_time) AS day, SUM(duration) AS total FROM website_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY site_id, day
+        ) s LEFT JOIN sites w ON w.id = s.site_id
+        ORDER BY s.day, s.total DESC
     ''', (start_date, end_date))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda date_str: date_str)
 def get_website_usage_by_hour(date_str):
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT strftime('%H', start_time) as hour, site, SUM(duration) FROM website_usage_logs
-        WHERE date(start_time) = ?
-        GROUP BY hour, site
-        ORDER BY hour, SUM(duration) DESC
+        SELECT s.hour, w.name, s.total FROM (
+            SELECT strftime('%H', start_time) AS hour, site_id, SUM(duration) AS total FROM website_facts
+            WHERE date(start_time) = ?
+            GROUP BY hour, site_id
+        ) s LEFT JOIN sites w ON w.id = s.site_id
+        ORDER BY s.hour, s.total DESC
     ''', (date_str,))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
 def get_website_usage_by_day(start_date, end_date):
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT date(start_time) as day, site, SUM(duration) FROM website_usage_logs
-        WHERE date(start_time) BETWEEN ? AND ?
-        GROUP BY day, site
-        ORDER BY day, SUM(duration) DESC
+        SELECT s.day, w.name, s.total FROM (
+            SELECT date(start_time) AS day, site_id, SUM(duration) AS total FROM website_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY day, site_id
+        ) s LEFT JOIN sites w ON w.id = s.site_id
+        ORDER BY s.day, s.total DESC
     ''', (start_date, end_date))
     results = c.fetchall()
     conn.close()
     return results
 
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
 def get_website_usage_by_week(start_date, end_date):
     conn = get_connection()
     c = conn.cursor()
     c.execute('''
-        SELECT strftime('%Y-%W', start_time) as week, site, SUM(duration) FROM website_usage_logs
-        WHERE date(start_time) BETWEEN ? AND ?
-        GROUP BY week, site
-        ORDER BY week, SUM(duration) DESC
+        SELECT s.week, w.name, s.total FROM (
+            SELECT strftime('%Y-%W', start_time) AS week, site_id, SUM(duration) AS total FROM website_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY week, site_id
+        ) s LEFT JOIN sites w ON w.id = s.site_id
+        ORDER BY s.week, s.total DESC
     ''', (start_date, end_date))
     results = c.fetchall()
     conn.close()
-    return results 
\ No newline at end of file
+    return results
+
+# Rollup suffix read for each granularity, bucket expression over its hour or day column,
+# and the key the bucket is reported as: hour 'YYYY-MM-DD HH', day 'YYYY-MM-DD', week the
+# date of its Monday, month 'YYYY-MM'
+GRANULARITIES = {
+    'hour': ('hourly', 'hour', "strftime('%Y-%m-%d %H', s.bucket * 3600, 'unixepoch')"),
+    'day': ('daily', 'day', "date(s.bucket * 86400, 'unixepoch')"),
+    # 1970-01-01 was a Thursday, so (day + 3) / 7 counts weeks from Monday 1969-12-29
+    'week': ('daily', '(day + 3) / 7', "date((s.bucket * 7 - 3) * 86400, 'unixepoch')"),
+    'month': ('daily', "strftime('%Y-%m', day * 86400, 'unixepoch')", 's.bucket'),
+}
+
+def _rollup_range(suffix, start_date, end_date):
+    """Time column and inclusive bounds of two dates in an hourly or daily rollup."""
+    first, last = epoch_hour(start_date + ' 00'), epoch_hour(end_date + ' 23')
+    if suffix == 'hourly':
+        return 'hour', (first, last)
+    return 'day', (first // 24, last // 24)
+
+@metrics.timed
+@cached(lambda start_date, end_date, granularity: end_date)
+def get_category_series(start_date, end_date, granularity):
+    """(bucket, category, minutes) of reported time (see categories.SYSTEM_PROCESSES) per
+    hour, day, week or month bucket in a date range, from category_hourly for hours and
+    category_daily otherwise."""
+    suffix, bucket, key = GRANULARITIES[granularity]
+    column, bounds = _rollup_range(suffix, start_date, end_date)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT {key}, k.name, s.total FROM (
+            SELECT {bucket} AS bucket, category_id, SUM(minutes) AS total FROM category_{suffix}
+            WHERE {column} BETWEEN ? AND ?
+            GROUP BY bucket, category_id
+        ) s JOIN categories k ON k.id = s.category_id
+        ORDER BY s.bucket
+    ''', bounds)
+    results = c.fetchall()
+    conn.close()
+    return results
+
+def _rollup_totals(prefix, column, dimension, start_date, end_date):
+    # Whole months of the range come from the monthly rollup, the days around them from
+    # the daily one (an empty span when lo > hi)
+    _, (first, last) = _rollup_range('daily', start_date, end_date)
+    first_month, last_month = epoch_month(first - 1) + 1, epoch_month(last + 1) - 1
+    if first_month > last_month:
+        params = (first, last, 1, 0, 1, 0)
+    else:
+        params = (first, _month_first_day(first_month) - 1, _month_first_day(last_month + 1), last,
+                  first_month, last_month)
+    conn = get_connection()
+    c = conn.cursor()
+    c.execute(f'''
+        SELECT d.name, coalesce(k.name, 'Others'), s.total FROM (
+            SELECT {column}, SUM(minutes) AS total FROM (
+                SELECT {column}, minutes FROM {prefix}_daily
+                WHERE day BETWEEN ? AND ? OR day BETWEEN ? AND ?
+                UNION ALL
+                SELECT {column}, minutes FROM {prefix}_monthly WHERE month BETWEEN ? AND ?
+            ) GROUP BY {column}
+        ) s JOIN {dimension} d ON d.id = s.{column}
+        LEFT JOIN categories k ON k.id = d.category_id
+        ORDER BY s.total DESC
+    ''', params)
+    results = c.fetchall()
+    conn.close()
+    return results
+
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
+def get_usage_totals(start_date, end_date):
+    """(app_name, category, minutes) between two dates (inclusive), most used first."""
+    return _rollup_totals('usage', 'app_id', 'apps', start_date, end_date)
+
+@metrics.timed
+@cached(lambda start_date, end_date: end_date)
+def get_website_usage_totals(start_date, end_date):
+    return _rollup_totals('website', 'site_id', 'sites', start_date, end_date)
+
+@metrics.timed
+def set_category(table, name, category):
+    """Move an app or site to another category: one row update, and its minutes moved
+    between the category rollups. Returns False if there is no such app or site."""
+    if table not in ('apps', 'sites'):
+        raise ValueError(f'not a dimension: {table}')
+    if category not in CATEGORIES:
+        raise ValueError(f'unknown category: {category}')
+    prefix, column = {'apps': ('usage', 'app_id'), 'sites': ('website', 'site_id')}[table]
+    new_id = CATEGORIES.index(category) + 1
+    conn = get_connection()
+    c = conn.cursor()
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        row = c.execute(f'SELECT id FROM {table} WHERE name = ?', (name,)).fetchone()
+        found = row is not None
+        if found:
+            old_id = _reported_categories(c, table, [row[0]]).get(row[0])
+            c.execute(f'UPDATE {table} SET category_id = ? WHERE id = ?', (new_id, row[0]))
+            if old_id is not None and old_id != new_id:
+                for bucket, suffix in (('hour', 'hourly'), ('day', 'daily')):
+                    minutes = c.execute(f'SELECT {bucket}, minutes FROM {prefix}_{suffix} WHERE {column} = ?', row).fetchall()
+                    _add_minutes(c, f'category_{suffix}', bucket, 'category_id', {(at, old_id): -m for at, m in minutes})
+                    _add_minutes(c, f'category_{suffix}', bucket, 'category_id', {(at, new_id): m for at, m in minutes})
+            # Cached reports of past days embed the old category
+            c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'history'")
+        c.execute('COMMIT')
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        raise
+    finally:
+        conn.close()
+    return found
+
+@metrics.timed
+def normalize_existing_titles(dry_run=False):
+    """Apply normalize_title to every stored title by setting titles.norm_id; usage rows
+    keep their raw title. Returns the titles whose norm_id changed, and distinct title
+    and (app, title) counts in use before and after grouping by norm_id."""
+    conn = get_connection()
+    c = conn.cursor()
+    distinct_titles = 'SELECT COUNT(DISTINCT coalesce(t.norm_id, t.id)) FROM usage_facts f JOIN titles t ON t.id = f.title_id'
+    distinct_pairs = '''
+        SELECT COUNT(*) FROM (
+            SELECT DISTINCT f.app_id, coalesce(t.norm_id, t.id) FROM usage_facts f JOIN titles t ON t.id = f.title_id
+        )
+    '''
+    report = {
+        'titles_before': c.execute('SELECT COUNT(DISTINCT title_id) FROM usage_facts').fetchone()[0],
+        'pairs_before': c.execute('SELECT COUNT(*) FROM (SELECT DISTINCT app_id, title_id FROM usage_facts)').fetchone()[0],
+    }
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        titles_updated = 0
+        for title_id, name, old_norm_id in c.execute('SELECT id, name, norm_id FROM titles').fetchall():
+            norm_id = title_id if normalize_title(name) == name else _dim_id(c, 'titles', normalize_title(name))
+            if norm_id != old_norm_id:
+                c.execute('UPDATE titles SET norm_id = ? WHERE id = ?', (norm_id, title_id))
+                titles_updated += 1
+            if norm_id != title_id:
+                c.execute('UPDATE titles SET norm_id = id WHERE id = ?', (norm_id,))
+        report['titles_after'] = c.execute(distinct_titles).fetchone()[0]
+        report['pairs_after'] = c.execute(distinct_pairs).fetchone()[0]
+        report['titles_updated'] = titles_updated
+        if dry_run:
+            c.execute('ROLLBACK')
+        else:
+            c.execute('COMMIT')
+        # The write path's record of which titles have a norm_id is stale either way
+        _forget_dim_cache()
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        _forget_dim_cache()
+        raise
+    finally:
+        conn.close()
+    return report
+
+@metrics.timed
+def rename_sites(canonical, dry_run=False):
+    """Point website rows at canonical(name) for every site name it changes (None keeps
+    the name), merging sites that end up with the same name. The old names stay in the
+    sites table with no rows. Returns {old: new} and the number of rows updated."""
+    conn = get_connection()
+    c = conn.cursor()
+    renamed = {}
+    rows_updated = 0
+    try:
+        c.execute('BEGIN IMMEDIATE')
+        for site_id, name in c.execute('SELECT id, name FROM sites').fetchall():
+            new = canonical(name)
+            if new and new != name:
+                renamed[name] = new
+                c.execute('UPDATE website_facts SET site_id = ? WHERE site_id = ?', (_dim_id(c, 'sites', new), site_id))
+                rows_updated += c.rowcount
+        if dry_run:
+            c.execute('ROLLBACK')
+            _forget_dim_cache()
+        else:
+            c.execute("UPDATE data_versions SET version = version + 1 WHERE name = 'history'")
+            c.execute('COMMIT')
+            if renamed:
+                rebuild_dimension_stats(c)
+                rebuild_hourly_aggregates(c)
+    except Exception:
+        if conn.in_transaction:
+            c.execute('ROLLBACK')
+        _forget_dim_cache()
+        raise
+    finally:
+        conn.close()
+    return {'renamed': renamed, 'rows_updated': rows_updated}
+
+def _like_pattern(text):
+    """LIKE pattern matching text anywhere, with % and _ in text taken literally (ESCAPE '\\')."""
+    return '%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+def _fts_query(text):
+    """FTS5 query matching every word of text as a prefix, without exposing the query
+    syntax: each word becomes a quoted string, so "ABC-123" is the phrase abc 123."""
+    words = text.split()
+    return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
+@metrics.timed
+def search_titles(text, start_date=None, end_date=None, limit=20, offset=0):
+    """Window titles matching text, best match first, that were used between start_date
+    and end_date (inclusive, either may be None).
+
+    Titles differing only by counters or markers count as one, under their normalized
+    form. Returns (total, results) where total counts every matching title and results
+    holds the requested page as (title, [app_name, ...], [(day, minutes), ...]) tuples.
+    """
+    if not text.split():
+        return 0, []
+    conn = get_connection()
+    c = conn.cursor()
+    used = 'SELECT 1 FROM usage_facts f WHERE f.title_id = t.id'
+    range_sql = ''
+    range_args = []
+    if start_date:
+        range_sql += ' AND f.start_time >= ?'
+        range_args.append(start_date)
+    if end_date:
+        range_sql += " AND f.start_time < date(?, '+1 day')"
+        range_args.append(end_date)
+    fts = c.execute("SELECT 1 FROM sqlite_master WHERE name = 'titles_fts'").fetchone()
+    if fts:
+        match_sql = f'''
+            FROM titles_fts s JOIN titles t ON t.id = s.rowid
+            WHERE titles_fts MATCH ? AND EXISTS ({used}{range_sql})
+        '''
+        match_args = [_fts_query(text)] + range_args
+        order_sql = 'ORDER BY MIN(s.rank), norm_id'
+    else:
+        match_sql = f"FROM titles t WHERE t.name LIKE ? ESCAPE '\\' AND EXISTS ({used}{range_sql})"
+        match_args = [_like_pattern(text)] + range_args
+        order_sql = 'ORDER BY norm_id'
+    # Matching titles are grouped by their normalized form (see normalize.py), which is the
+    # title shown; norm_id is only NULL for titles the write path has not seen
+    norm_sql = 'coalesce(t.norm_id, t.id)'
+    total = c.execute(f'SELECT COUNT(DISTINCT {norm_sql}) {match_sql}', match_args).fetchone()[0]
+    ids = [row[0] for row in c.execute(f'SELECT {norm_sql} AS norm_id {match_sql} GROUP BY norm_id {order_sql} LIMIT ? OFFSET ?',
+                                       match_args + [limit, offset])]
+    if not ids:
+        conn.close()
+        return total, []
+    marks = ','.join('?' * len(ids))
+    names = dict(c.execute(f'SELECT id, name FROM titles WHERE id IN ({marks})', ids))
+    c.execute(f'''
+        SELECT {norm_sql} AS norm_id, a.name, date(f.start_time) AS day, SUM(f.duration) FROM titles t
+        JOIN usage_facts f ON f.title_id = t.id
+        LEFT JOIN apps a ON a.id = f.app_id
+        WHERE (t.norm_id IN ({marks}) OR t.id IN ({marks})){range_sql}
+        GROUP BY norm_id, f.app_id, day
+    ''', ids + ids + range_args)
+    apps = {norm_id: [] for norm_id in ids}
+    days = {norm_id: {} for norm_id in ids}
+    for norm_id, app_name, day, minutes in c.fetchall():
+        if app_name not in apps[norm_id]:
+            apps[norm_id].append(app_name)
+        days[norm_id][day] = days[norm_id].get(day, 0) + minutes
+    conn.close()
+    return total, [(names[norm_id], apps[norm_id], sorted(days[norm_id].items())) for norm_id in ids]
+
+# Column names and query for each export kind; every query takes (start_date, end_date)
+EXPORT_QUERIES = {
+    'usage': (('id', 'app_name', 'title', 'start_time', 'end_time', 'duration'), '''
+        SELECT id, app_name, title, start_time, end_time, duration FROM usage_logs
+        WHERE date(start_time) BETWEEN ? AND ?
+        ORDER BY id
+    '''),
+    'website': (('id', 'site', 'browser', 'start_time', 'end_time', 'duration'), '''
+        SELECT id, site, browser, start_time, end_time, duration FROM website_usage_logs
+        WHERE date(start_time) BETWEEN ? AND ?
+        ORDER BY id
+    '''),
+    'usage_daily': (('day', 'app_name', 'minutes'), '''
+        SELECT s.day, a.name, s.total FROM (
+            SELECT date(start_time) AS day, app_id, SUM(duration) AS total FROM usage_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY day, app_id
+        ) s LEFT JOIN apps a ON a.id = s.app_id
+        ORDER BY s.day, a.name
+    '''),
+    'website_daily': (('day', 'site', 'minutes'), '''
+        SELECT s.day, w.name, s.total FROM (
+            SELECT date(start_time) AS day, site_id, SUM(duration) AS total FROM website_facts
+            WHERE date(start_time) BETWEEN ? AND ?
+            GROUP BY day, site_id
+        ) s LEFT JOIN sites w ON w.id = s.site_id
+        ORDER BY s.day, w.name
+    '''),
+}
+
+def iter_export_rows(kind, start_date, end_date, chunk_size=5000):
+    """Yield lists of up to chunk_size rows for an export kind, reading with fetchmany
+    so memory use does not depend on how many rows match."""
+    _, sql = EXPORT_QUERIES[kind]
+    conn = get_connection()
+    try:
+        c = conn.cursor()
+        c.execute(sql, (start_date, end_date))
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        conn.close()
+
+def iter_usage_intervals(start_date, end_date, chunk_size=5000):
+    """Yield (host, user, app_name, start_time, end_time) for every usage row that starts
+    between the two dates (inclusive), in start_time order, one row at a time."""
+    conn = get_connection()
+    try:
+        c = conn.cursor()
+        c.execute('''
+            SELECT f.host, f.user, a.name, f.start_time, f.end_time FROM usage_facts f
+            LEFT JOIN apps a ON a.id = f.app_id
+            WHERE f.start_time >= ? AND f.start_time < date(?, '+1 day')
+            ORDER BY f.start_time, f.id
+        ''', (start_date, end_date))
+        while True:
+            rows = c.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield from rows
+    finally:
+        conn.close()
+
+LOG_QUERIES = {
+    'usage': '''
+        SELECT f.id, a.name, t.name, f.start_time, f.end_time, f.duration, f.host, f.user FROM usage_facts f
+        LEFT JOIN apps a ON a.id = f.app_id
+        LEFT JOIN titles t ON t.id = f.title_id
+    ''',
+    'website': '''
+        SELECT f.id, s.name, b.name, f.start_time, f.end_time, f.duration, f.host, f.user FROM website_facts f
+        LEFT JOIN sites s ON s.id = f.site_id
+        LEFT JOIN browsers b ON b.id = f.browser_id
+    ''',
+}
+
+# A title filter matching at most this many titles reads each one from the
+# (title_id, start_time) index; broader ones walk the start_time index instead
+LOG_TITLE_LOOKUPS = 32
+
+@metrics.timed
+def get_log_page(kind, limit=100, after=None, ascending=False, name=None, title=None, start_date=None, end_date=None):
+    """One page of raw usage or website rows in (start_time, id) order, newest first unless
+    ascending, as (id, app or site, title or browser, start_time, end_time, duration, host, user).
+
+    after is the (start_time, id) of the last row of the previous page. The page is read
+    from an index on start_time starting at that key, so deep pages cost the same as the
+    first. name is an exact app (usage) or site (website) name, title a substring of the
+    window title (usage only), which also matches titles differing only by counters or
+    markers; dates are inclusive.
+    """
+    where = ['f.start_time IS NOT NULL']
+    args = []
+    if name is not None:
+        dimension, column = ('apps', 'app_id') if kind == 'usage' else ('sites', 'site_id')
+        where.append(f'f.{column} = (SELECT id FROM {dimension} WHERE name = ?)')
+        args.append(name)
+    if start_date:
+        where.append('f.start_time >= ?')
+        args.append(start_date)
+    if end_date:
+        where.append("f.start_time < date(?, '+1 day')")
+        args.append(end_date)
+    if after is not None:
+        op = '>' if ascending else '<'
+        # Spelled out rather than as a row value so older SQLite versions still use the index
+        where.append(f'f.start_time {op}= ? AND (f.start_time {op} ? OR f.id {op} ?)')
+        args += [after[0], after[0], after[1]]
+    direction = 'ASC' if ascending else 'DESC'
+    conn = get_connection()
+    c = conn.cursor()
+    title_ids = [None]
+    if title:
+        # Rows of every title with the same normalized form as a match (see normalize.py)
+        matching = '''
+            SELECT id FROM titles WHERE name LIKE ? ESCAPE '\\'
+            UNION SELECT id FROM titles WHERE norm_id IN (SELECT norm_id FROM titles WHERE name LIKE ? ESCAPE '\\')
+        '''
+        title_ids = [row[0] for row in c.execute(f'{matching} LIMIT ?',
+                                                 (_like_pattern(title), _like_pattern(title), LOG_TITLE_LOOKUPS + 1))]
+        if len(title_ids) > LOG_TITLE_LOOKUPS:
+            # The unary + keeps SQLite from sorting every match out of the title index
+            where.append(f'+f.title_id IN ({matching})')
+            args += [_like_pattern(title), _like_pattern(title)]
+            title_ids = [None]
+    pages = []
+    for title_id in title_ids:
+        title_sql = ' AND f.title_id = ?' if title_id is not None else ''
+        title_args = [title_id] if title_id is not None else []
+        c.execute(f'''{LOG_QUERIES[kind]}
+            WHERE {' AND '.join(where)}{title_sql}
+            ORDER BY f.start_time {direction}, f.id {direction}
+            LIMIT ?
+        ''', args + title_args + [limit])
+        pages.append(c.fetchall())
+    conn.close()
+    if len(pages) == 1:
+        return pages[0]
+    merged = heapq.merge(*pages, key=lambda row: (row[3], row[0]), reverse=not ascending)
+    return list(itertools.islice(merged, limit))
+
+@metrics.timed
+@cached(lambda start_date, end_date, by_weekday=False: end_date)
+def get_category_minutes(start_date, end_date, by_weekday=False):
+    """(slot, category code, minutes) of reported time from category_hourly between two
+    dates (inclusive); the code is the index in CATEGORIES. slot is the hour as returned
+    by epoch_hour, or with by_weekday the hour of the week (Monday 00:00 = 0), summed
+    over the range."""
+    conn = get_connection()
+    c = conn.cursor()
+    # categories rows are CATEGORIES in order, from id 1
+    if by_weekday:
+        # 1970-01-01 was a Thursday, 72 hours into its week
+        c.execute('''
+            SELECT (hour + 72) % 168 AS slot, category_id - 1, SUM(minutes) FROM category_hourly
+            WHERE hour BETWEEN ? AND ?
+            GROUP BY slot, category_id
+        ''', (epoch_hour(start_date + ' 00'), epoch_hour(end_date + ' 23')))
+    else:
+        c.execute('SELECT hour, category_id - 1, minutes FROM category_hourly WHERE hour BETWEEN ? AND ?',
+                  (epoch_hour(start_date + ' 00'), epoch_hour(end_date + ' 23')))
+    results = c.fetchall()
+    conn.close()
+    return results
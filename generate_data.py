@@ -0,0 +1,197 @@
+"""Fill an app usage database with synthetic, realistic-looking data.
+
+The generated rows go through the same schema as the tracker (``database.init_db``),
+so dashboards and benchmarks see exactly what a long-running install would produce.
+Output is fully deterministic for a given seed and set of arguments.
+
+Example:
+    python generate_data.py --db bench.db --days 365 --users 4 --seed 1
+"""
+import argparse
+import os
+import random
+import time
+from datetime import datetime, timedelta
+
+import database
+
+# (process name, title suffix) pairs used for the most popular apps; extra apps are synthetic
+KNOWN_APPS = [
+    ('chrome.exe', 'Google Chrome'),
+    ('code.exe', 'Visual Studio Code'),
+    ('outlook.exe', 'Outlook'),
+    ('slack.exe', 'Slack'),
+    ('teams.exe', 'Microsoft Teams'),
+    ('word.exe', 'Word'),
+    ('excel.exe', 'Excel'),
+    ('msedge.exe', 'Microsoft Edge'),
+    ('firefox.exe', 'Mozilla Firefox'),
+    ('spotify.exe', 'Spotify'),
+    ('discord.exe', 'Discord'),
+    ('pycharm64.exe', 'PyCharm'),
+    ('explorer.exe', 'File Explorer'),
+    ('notepad++.exe', 'Notepad++'),
+    ('obsidian.exe', 'Obsidian'),
+    ('zoom.exe', 'Zoom'),
+    ('powerpnt.exe', 'PowerPoint'),
+    ('onenote.exe', 'OneNote'),
+]
+BROWSERS = {'chrome.exe', 'msedge.exe', 'firefox.exe'}
+# Domains, as sites.extract_site reports them
+SITES = [
+    'youtube.com', 'github.com', 'reddit.com', 'stackoverflow.com', 'twitter.com', 'docs.google.com',
+    'instagram.com', 'wikipedia.org', 'facebook.com', 'netflix.com', 'twitch.tv', 'linkedin.com',
+    'discord.com', 'localhost', 'pinterest.com', 'quora.com', 'tiktok.com', 'imgur.com', 'tumblr.com',
+    '9gag.com', 'kick.com',
+]
+
+
+def zipf_weights(n, s):
+    """Cumulative Zipf(s) weights for ranks 1..n, for use with ``random.choices``."""
+    total = 0.0
+    cum = []
+    for rank in range(1, n + 1):
+        total += 1.0 / (rank ** s)
+        cum.append(total)
+    return cum
+
+
+def build_catalog(num_apps, titles_per_app):
+    """Return a list of (app_name, [titles]) with realistic names for the first apps."""
+    catalog = []
+    for i in range(num_apps):
+        if i < len(KNOWN_APPS):
+            app_name, suffix = KNOWN_APPS[i]
+        else:
+            app_name, suffix = f'app{i}.exe', f'App {i}'
+        if app_name in BROWSERS:
+            titles = [f'Page {t} - {suffix}' for t in range(titles_per_app)]
+        else:
+            titles = [f'document_{t} - {suffix}' for t in range(titles_per_app)]
+        catalog.append((app_name, titles))
+    return catalog
+
+
+def generate_rows(args):
+    """Yield ('usage', row) and ('website', row) tuples in start_time order per user."""
+    rng = random.Random(args.seed)
+    catalog = build_catalog(args.apps, args.titles)
+    app_cum = zipf_weights(len(catalog), args.zipf)
+    title_cum = zipf_weights(args.titles, args.zipf)
+    site_cum = zipf_weights(len(SITES), args.zipf)
+    app_indexes = range(len(catalog))
+    title_indexes = range(args.titles)
+    mean_stay = 3600.0 / args.switch_rate  # seconds spent on a window before switching
+    flush = args.flush_seconds
+    end_day = datetime.strptime(args.end_date, '%Y-%m-%d') if args.end_date else datetime.now()
+    end_day = end_day.replace(hour=0, minute=0, second=0, microsecond=0)
+    first_day = end_day - timedelta(days=args.days - 1)
+    start_hour, stop_hour = args.active_hours
+    for user in range(args.users):
+        # A single simulated user looks like a local install, where user is NULL
+        user_name = f'user{user}' if args.users > 1 else None
+        for d in range(args.days):
+            day = first_day + timedelta(days=d)
+            prefix = day.strftime('%Y-%m-%d')
+            # Jitter the working day a little per user and day
+            t = start_hour * 3600 + rng.randint(0, 3600)
+            stop = min(stop_hour * 3600 + rng.randint(-1800, 1800), 86399)
+
+            def stamp(sec):
+                return f'{prefix} {sec // 3600:02d}:{sec % 3600 // 60:02d}:{sec % 60:02d}'
+            while t < stop:
+                app_idx = rng.choices(app_indexes, cum_weights=app_cum)[0]
+                app_name, titles = catalog[app_idx]
+                title = titles[rng.choices(title_indexes, cum_weights=title_cum)[0]]
+                stay = max(1, int(rng.expovariate(1.0 / mean_stay)))
+                stay = min(stay, stop - t)
+                if app_name in BROWSERS and rng.random() < args.site_mix:
+                    site = SITES[rng.choices(range(len(SITES)), cum_weights=site_cum)[0]]
+                    yield 'website', (site, app_name, stamp(t), stamp(t + stay), stay / 60.0, None, user_name)
+                # The tracker flushes a still-focused window every few seconds, so long stays
+                # become many short rows.
+                seg_start = t
+                seg_end_total = t + stay
+                while seg_start < seg_end_total:
+                    seg_end = min(seg_start + flush, seg_end_total)
+                    yield 'usage', (app_name, title, stamp(seg_start), stamp(seg_end), (seg_end - seg_start) / 60.0, None, user_name)
+                    seg_start = seg_end
+                t += stay
+
+
+def write_rows(rows, batch_size):
+    """Insert generated rows with bulk executemany transactions, through the same
+    dimension-interning write path as the tracker. Returns row counts."""
+    conn = database.get_connection()
+    c = conn.cursor()
+    c.execute('PRAGMA synchronous=OFF;')
+    usage_batch = []
+    website_batch = []
+    counts = {'usage': 0, 'website': 0}
+
+    def flush():
+        c.execute('BEGIN')
+        database.write_usage_rows(c, usage_batch)
+        database.write_website_rows(c, website_batch)
+        c.execute('COMMIT')
+        counts['usage'] += len(usage_batch)
+        counts['website'] += len(website_batch)
+        usage_batch.clear()
+        website_batch.clear()
+
+    for kind, row in rows:
+        if kind == 'usage':
+            usage_batch.append(row)
+        else:
+            website_batch.append(row)
+        if len(usage_batch) + len(website_batch) >= batch_size:
+            flush()
+    flush()
+    conn.close()
+    return counts
+
+
+def generate(args):
+    if os.path.exists(args.db):
+        if not args.force:
+            raise SystemExit(f'{args.db} already exists (use --force to overwrite)')
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+    database.DB_NAME = args.db
+    database.init_db()
+    return write_rows(generate_rows(args), args.batch_size)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic app usage database.')
+    parser.add_argument('--db', default='synthetic_usage.db', help='output database file')
+    parser.add_argument('--days', type=int, default=30, help='number of days of history')
+    parser.add_argument('--end-date', help='last generated day (YYYY-MM-DD), defaults to today')
+    parser.add_argument('--users', type=int, default=1, help='number of simulated users')
+    parser.add_argument('--apps', type=int, default=30, help='number of distinct apps')
+    parser.add_argument('--titles', type=int, default=200, help='distinct window titles per app')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Zipf exponent for app/title/site popularity')
+    parser.add_argument('--switch-rate', type=float, default=40.0, help='window switches per hour')
+    parser.add_argument('--site-mix', type=float, default=0.5, help='fraction of browser stays on a recognized site')
+    parser.add_argument('--active-hours', type=int, nargs=2, default=(8, 22), metavar=('START', 'STOP'),
+                        help='hours of the day with activity')
+    parser.add_argument('--flush-seconds', type=int, default=10, help='max row length, like the tracker flush')
+    parser.add_argument('--batch-size', type=int, default=50000, help='rows per insert transaction')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    parser.add_argument('--force', action='store_true', help='overwrite an existing database')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    started = time.perf_counter()
+    counts = generate(args)
+    elapsed = time.perf_counter() - started
+    total = counts['usage'] + counts['website']
+    print(f"Wrote {counts['usage']} usage rows and {counts['website']} website rows to {args.db} "
+          f"in {elapsed:.1f}s ({total / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,271 @@
+"""Append-only, memory-mapped event journal in front of the database.
+
+The tracker appends one fixed-size binary record per usage or website interval; that is
+a struct pack and a copy into a memory-mapped file, with no SQLite work and no fsync on
+the tracker thread. A background ingester folds the pending records into the database
+in large transactions (``database.ingest_journal``) and then truncates the journal.
+
+Files, next to the database:
+
+    <db>.events          64-byte header (magic, journal id, next seq) + records
+    <db>.events.strings  journal-local string table: (uint32 length, utf-8 bytes)*
+    <db>.events.lock     held while a process owns the journal
+
+Strings (app names, titles, sites, browsers) are interned to ids in the side file, which
+is written before any record that refers to it and cleared whenever the journal empties.
+Every record carries a sequence number and the database remembers the highest one it
+applied per journal, so records that were ingested but not yet truncated when the
+process died are skipped on replay instead of being counted twice. Seqs increase through
+the file, so a record whose seq is not above the one before it is a stale copy (a crash
+in ``_truncate`` after moving the tail leaves one) and is skipped the same way.
+"""
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import database
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_ENABLED = os.environ.get('APPUSAGE_JOURNAL', 'on') != 'off'
+INGEST_SECONDS = float(os.environ.get('APPUSAGE_JOURNAL_INGEST_SECONDS', 5))
+
+MAGIC = b'AUJ1'
+HEADER = struct.Struct('<4s16sQ')
+HEADER_SIZE = 64
+# kind, name id, second name id, seq, start, end (seconds since EPOCH), duration (minutes)
+RECORD = struct.Struct('<B3xIIQqqd')
+KIND_USAGE = 1
+KIND_WEBSITE = 2
+KINDS = {KIND_USAGE: 'usage', KIND_WEBSITE: 'website'}
+EPOCH = datetime(1970, 1, 1)  # naive, like the tracker's local timestamps
+GROW_RECORDS = 4096
+
+
+class JournalBusy(OSError):
+    """Another process has the journal open."""
+
+
+def _lock(path):
+    """Open and exclusively lock ``path``, so only one process owns a journal."""
+    f = open(path, 'a+b')
+    try:
+        if os.name == 'nt':
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        raise JournalBusy(f'{path} is locked by another process')
+    return f
+
+
+def _seconds(dt):
+    return (dt - EPOCH) // timedelta(seconds=1)
+
+
+def _timestamp(seconds):
+    return (EPOCH + timedelta(seconds=seconds)).strftime('%Y-%m-%d %H:%M:%S')
+
+
+class EventJournal:
+    def __init__(self, path=None, ingest_seconds=INGEST_SECONDS):
+        self.path = path or database.DB_NAME + '.events'
+        self.strings_path = self.path + '.strings'
+        self.ingest_seconds = ingest_seconds
+        self.lock = threading.Lock()
+        self.ingest_lock = threading.Lock()
+        self.ingested = 0
+        self.last_ingest_seconds = None
+        self.ingest_failures = 0
+        self.last_ingest_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.lock_file = _lock(self.path + '.lock')
+        self._open()
+
+
+    def _open(self):
+        new = not os.path.exists(self.path) or os.path.getsize(self.path) < HEADER_SIZE
+        self.file = open(self.path, 'w+b' if new else 'r+b')
+        if new:
+            self.file.truncate(HEADER_SIZE + GROW_RECORDS * RECORD.size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+        if new:
+            self.journal_id = uuid.uuid4().hex
+            self.next_seq = 1
+            self._write_header()
+        else:
+            magic, raw_id, self.next_seq = HEADER.unpack_from(self.map, 0)
+            if magic != MAGIC:
+                raise ValueError(f'{self.path} is not an event journal')
+            self.journal_id = raw_id.hex()
+        # Records end at the first slot whose kind byte was never set
+        self.end = HEADER_SIZE
+        while self.end + RECORD.size <= len(self.map) and self.map[self.end] in KINDS:
+            self.next_seq = max(self.next_seq, RECORD.unpack_from(self.map, self.end)[3] + 1)
+            self.end += RECORD.size
+        self._load_strings()
+
+    def _write_header(self):
+        HEADER.pack_into(self.map, 0, MAGIC, bytes.fromhex(self.journal_id), self.next_seq)
+
+    def _load_strings(self):
+        self.strings = [None]
+        self.string_ids = {}
+        mode = 'r+b' if os.path.exists(self.strings_path) else 'w+b'
+        self.strings_file = open(self.strings_path, mode)
+        data = self.strings_file.read()
+        pos = 0
+        while pos + 4 <= len(data):
+            (length,) = struct.unpack_from('<I', data, pos)
+            if pos + 4 + length > len(data):
+                break
+            text = data[pos + 4:pos + 4 + length].decode('utf-8', 'surrogatepass')
+            self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+            pos += 4 + length
+        # Drop a string cut short by a crash; no record can refer to it
+        self.strings_file.truncate(pos)
+        self.strings_file.seek(pos)
+
+    def _intern(self, text):
+        if text is None:
+            return 0
+        string_id = self.string_ids.get(text)
+        if string_id is None:
+            data = text.encode('utf-8', 'surrogatepass')
+            self.strings_file.write(struct.pack('<I', len(data)) + data)
+            self.strings_file.flush()
+            string_id = self.string_ids[text] = len(self.strings)
+            self.strings.append(text)
+        return string_id
+
+    def _resize(self, size):
+        self.map.close()
+        self.file.truncate(size)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+
+
+    def _append(self, kind, name, name2, start_time, end_time, duration):
+        with self.lock:
+            if self.end + RECORD.size > len(self.map):
+                self._resize(len(self.map) + GROW_RECORDS * RECORD.size)
+            record = RECORD.pack(kind, self._intern(name), self._intern(name2), self.next_seq,
+                                 _seconds(start_time), _seconds(end_time), duration)
+            # The kind byte goes in last, so a torn record reads as the end of the journal
+            self.map[self.end + 1:self.end + RECORD.size] = record[1:]
+            self.map[self.end] = kind
+            self.end += RECORD.size
+            self.next_seq += 1
+
+    def append_usage(self, app_name, title, start_time, end_time, duration):
+        """Queue one app interval; start_time and end_time are datetimes."""
+        self._append(KIND_USAGE, app_name, title, start_time, end_time, duration)
+
+    def append_website(self, site, browser, start_time, end_time, duration):
+        self._append(KIND_WEBSITE, site, browser, start_time, end_time, duration)
+
+    def pending(self):
+        return (self.end - HEADER_SIZE) // RECORD.size
+
+
+    def ingest(self):
+        """Fold every pending record into the database and truncate. Returns records applied."""
+        with self.ingest_lock:
+            started = time.monotonic()
+            with self.lock:
+                end = self.end
+                data = self.map[HEADER_SIZE:end]
+                strings = self.strings[:]
+            records = []
+            for kind, name_id, name2_id, seq, start, stop, duration in RECORD.iter_unpack(data):
+                records.append((seq, KINDS[kind], (strings[name_id], strings[name2_id],
+                                                   _timestamp(start), _timestamp(stop), duration, None, None)))
+            applied = database.ingest_journal(self.journal_id, records) if records else 0
+            with self.lock:
+                self._truncate(end)
+            self.ingested += applied
+            self.last_ingest_seconds = time.monotonic() - started
+            return applied
+
+    def _truncate(self, upto):
+        """Drop records before offset ``upto``, keeping any appended since. Caller holds the lock."""
+        tail = self.map[upto:self.end]
+        # Persist the next seq first: once the records are gone it is only in the header
+        self._write_header()
+        self.map[HEADER_SIZE:HEADER_SIZE + len(tail)] = tail
+        self.map[HEADER_SIZE + len(tail):self.end] = bytes(self.end - HEADER_SIZE - len(tail))
+        self.end = HEADER_SIZE + len(tail)
+        if not tail:
+            # Nothing refers to the string table any more
+            self.strings_file.truncate(0)
+            self.strings_file.seek(0)
+            self.strings = [None]
+            self.string_ids = {}
+            if len(self.map) > HEADER_SIZE + GROW_RECORDS * RECORD.size:
+                self._resize(HEADER_SIZE + GROW_RECORDS * RECORD.size)
+
+    def _ingest_loop(self):
+        while not self._stop.wait(self.ingest_seconds):
+            try:
+                self.ingest()
+            except Exception as e:
+                # The records stay in the journal and are retried on the next pass
+                self.ingest_failures += 1
+                self.last_ingest_error = f'{type(e).__name__}: {e}'
+                logger.warning('Event journal ingest failed: %s', self.last_ingest_error)
+
+    def start(self):
+        """Replay whatever a previous run left behind, then ingest in the background."""
+        self.ingest()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._ingest_loop, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.ingest()
+        finally:
+            # Anything not ingested stays on disk for the next replay
+            self.map.flush()
+            self.map.close()
+            self.file.close()
+            self.strings_file.close()
+            self.lock_file.close()
+
+    def get_stats(self):
+        return {
+            'pending': self.pending(),
+            'ingested': self.ingested,
+            'last_ingest_ms': round(self.last_ingest_seconds * 1000.0, 3) if self.last_ingest_seconds is not None else None,
+            'ingest_failures': self.ingest_failures,
+            'last_ingest_error': self.last_ingest_error,
+        }
+
+
+def replay(path=None):
+    """Ingest a journal left behind by a tracker that is no longer running."""
+    path = path or database.DB_NAME + '.events'
+    if not os.path.exists(path):
+        return 0
+    try:
+        journal = EventJournal(path)
+    except JournalBusy:
+        return 0
+    try:
+        return journal.ingest()
+    finally:
+        journal.close()
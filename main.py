@@ -1,4 +1,33 @@
-from ui import main
- 
+import argparse
+
+
+def run_headless(host, port, track=True):
+    """Start only the tracker and the HTTP API, without loading any GUI toolkit."""
+    from database import init_db
+    import webapp
+    init_db()
+    if track:
+        webapp.get_tracker().start()
+        webapp.tracking_state['running'] = True
+    try:
+        webapp.app.run(host=host, port=port, debug=False, use_reloader=False)
+    finally:
+        webapp.close_tracker()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='App Usage Monitor')
+    parser.add_argument('--headless', action='store_true', help='run the tracker and HTTP API without a GUI')
+    parser.add_argument('--host', default='127.0.0.1', help='API bind address in headless mode')
+    parser.add_argument('--port', type=int, default=5000, help='API port in headless mode')
+    parser.add_argument('--no-tracker', action='store_true', help='in headless mode, serve the API only')
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    args = parse_args()
+    if args.headless:
+        run_headless(args.host, args.port, track=not args.no_tracker)
+    else:
+        from ui import main
+        main()
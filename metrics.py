@@ -0,0 +1,262 @@
+"""Opt-in timing instrumentation, exported in Prometheus text format.
+
+Disabled by default; when disabled every hook is a single flag check. Enable with the
+APPUSAGE_METRICS=1 environment variable or by calling ``enable()``. Set
+APPUSAGE_SLOW_QUERY_MS to also log SQL statements slower than that many milliseconds,
+with their parameters and EXPLAIN QUERY PLAN output, as JSON lines to
+APPUSAGE_SLOW_QUERY_LOG (default slow_queries.log).
+"""
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+ENABLED = os.environ.get('APPUSAGE_METRICS', '') not in ('', '0')
+SLOW_QUERY_MS = float(os.environ['APPUSAGE_SLOW_QUERY_MS']) if os.environ.get('APPUSAGE_SLOW_QUERY_MS') else None
+SLOW_QUERY_LOG = os.environ.get('APPUSAGE_SLOW_QUERY_LOG', 'slow_queries.log')
+
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# metric name -> (help text, label name)
+METRICS = {
+    'appusage_db_call_seconds': ('Time spent in database.py functions.', 'function'),
+    'appusage_sql_seconds': ('Time spent executing and fetching SQL, by calling database.py function.', 'function'),
+    'appusage_http_request_seconds': ('Time spent handling HTTP requests, by route.', 'route'),
+    'appusage_json_dumps_seconds': ('Time spent serializing JSON responses, by route.', 'route'),
+    'appusage_tracker_tick_seconds': ('Tracker loop iteration time, in total and by phase.', 'phase'),
+}
+ROWS_METRIC = 'appusage_db_rows_returned_total'
+
+_lock = threading.Lock()
+_histograms = {}  # (metric, label value) -> Histogram
+_rows = {}  # function -> rows returned
+_local = threading.local()
+_slow_log_lock = threading.Lock()
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.total += seconds
+        self.count += 1
+
+
+def enable(slow_query_ms=None, slow_query_log=None):
+    global ENABLED, SLOW_QUERY_MS, SLOW_QUERY_LOG
+    ENABLED = True
+    if slow_query_ms is not None:
+        SLOW_QUERY_MS = slow_query_ms
+    if slow_query_log is not None:
+        SLOW_QUERY_LOG = slow_query_log
+
+
+def disable():
+    global ENABLED
+    ENABLED = False
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _rows.clear()
+
+
+def observe(metric, label, seconds):
+    if not ENABLED:
+        return
+    with _lock:
+        hist = _histograms.get((metric, label))
+        if hist is None:
+            hist = _histograms[(metric, label)] = Histogram()
+        hist.observe(seconds)
+
+
+def add_rows(function, rows):
+    if not ENABLED:
+        return
+    with _lock:
+        _rows[function] = _rows.get(function, 0) + rows
+
+
+class timer:
+    """Context manager that records the wall time of its block into ``metric``."""
+
+    def __init__(self, metric, label):
+        self.metric = metric
+        self.label = label
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.metric, self.label, time.perf_counter() - self.started)
+        return False
+
+
+def timed(fn):
+    """Decorator for database.py functions: records call latency and rows returned."""
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        outer = getattr(_local, 'function', None)
+        _local.function = name
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        finally:
+            observe('appusage_db_call_seconds', name, time.perf_counter() - started)
+            _local.function = outer
+        if isinstance(result, (list, tuple, dict)):
+            add_rows(name, len(result))
+        return result
+    return wrapper
+
+
+def connection_factory():
+    """The sqlite3 connection class to use: instrumented only while metrics are enabled."""
+    return InstrumentedConnection if ENABLED else sqlite3.Connection
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times execute + fetch per statement and logs slow statements."""
+
+    def execute(self, sql, parameters=()):
+        self._sql = sql
+        self._params = parameters
+        self._elapsed = 0.0
+        self._logged = False
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._finish(time.perf_counter() - started)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._sql = sql
+        self._params = None
+        self._elapsed = 0.0
+        self._logged = False
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._finish(time.perf_counter() - started)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._finish(time.perf_counter() - started)
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._finish(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._finish(time.perf_counter() - started)
+
+    def _finish(self, seconds):
+        if not hasattr(self, '_sql'):
+            return
+        observe('appusage_sql_seconds', getattr(_local, 'function', None) or 'other', seconds)
+        self._elapsed += seconds
+        if SLOW_QUERY_MS is not None and not self._logged and self._elapsed * 1000.0 >= SLOW_QUERY_MS:
+            self._logged = True
+            log_slow_query(self.connection, self._sql, self._params, self._elapsed)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def log_slow_query(conn, sql, params, seconds):
+    plan = None
+    statement = sql.lstrip().upper()
+    if statement.startswith('SELECT') or statement.startswith('WITH'):
+        try:
+            # A plain cursor, so the plan query is not itself instrumented
+            cur = sqlite3.Cursor(conn)
+            plan = [row[-1] for row in cur.execute('EXPLAIN QUERY PLAN ' + sql, params or ())]
+        except sqlite3.Error as e:
+            plan = [f'unavailable: {e}']
+    entry = {
+        'time': datetime.now().isoformat(timespec='milliseconds'),
+        'function': getattr(_local, 'function', None),
+        'ms': round(seconds * 1000.0, 3),
+        'sql': ' '.join(sql.split()),
+        'params': list(params) if isinstance(params, (list, tuple)) else params,
+        'plan': plan,
+    }
+    with _slow_log_lock:
+        with open(SLOW_QUERY_LOG, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    """All collected metrics in the Prometheus text exposition format."""
+    with _lock:
+        histograms = {key: (list(h.counts), h.total, h.count) for key, h in _histograms.items()}
+        rows = dict(_rows)
+    lines = [
+        '# HELP appusage_metrics_enabled Whether instrumentation is collecting.',
+        '# TYPE appusage_metrics_enabled gauge',
+        f'appusage_metrics_enabled {1 if ENABLED else 0}',
+    ]
+    for metric, (help_text, label_name) in METRICS.items():
+        series = sorted((label, data) for (m, label), data in histograms.items() if m == metric)
+        if not series:
+            continue
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} histogram')
+        for label, (counts, total, count) in series:
+            label_str = f'{label_name}="{_escape(label)}"'
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{{label_str},le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{{label_str},le="+Inf"}} {count}')
+            lines.append(f'{metric}_sum{{{label_str}}} {total:.6f}')
+            lines.append(f'{metric}_count{{{label_str}}} {count}')
+    if rows:
+        lines.append(f'# HELP {ROWS_METRIC} Rows returned by database.py functions.')
+        lines.append(f'# TYPE {ROWS_METRIC} counter')
+        for function, n in sorted(rows.items()):
+            lines.append(f'{ROWS_METRIC}{{function="{_escape(function)}"}} {n}')
+    return '\n'.join(lines) + '\n'
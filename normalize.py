@@ -0,0 +1,115 @@
+"""Window title normalization.
+
+Titles such as "(3) Inbox - Outlook" and "(4) Inbox - Outlook", or "● app.py - VSCode" and
+"app.py - VSCode", are the same window for reporting purposes. The tracker compares
+normalized titles, so counter and dirty-marker changes do not split intervals. Titles are
+stored as seen; the write path links each one to its normalized form (titles.norm_id),
+which title-level reports group by.
+
+Rules are applied in order; APPUSAGE_TITLE_RULES selects them by name (comma separated,
+default: all). Rules are applied until the title stops changing, so normalizing an
+already normalized title returns it unchanged; the examples in normalize_title() check
+this and run with ``python -m doctest normalize.py``.
+
+Existing databases (or a new rule selection) are brought in line with
+``python normalize.py``, which prints how much the number of distinct titles and
+(app, title) pairs went down.
+"""
+import argparse
+import os
+import re
+from functools import lru_cache
+
+DIVIDER = r'(?=\s+[-–—|]\s|$)'  # end of title or start of a " - App" style suffix
+
+RULES = [
+    # "(3) Inbox - Outlook", "Inbox (12) - Outlook", "[2] Slack"
+    ('unread', re.compile(r'^\s*[(\[]\d+\+?[)\]]\s*'), ''),
+    ('unread', re.compile(r'\s+[(\[]\d+\+?[)\]]' + DIVIDER), ''),
+    # "● app.py - VSCode", "app.py ● - VSCode", "*notes.txt - Notepad", "notes.txt* - Notepad++"
+    ('dirty', re.compile(r'\s*[●•◆]\s*'), ' '),
+    ('dirty', re.compile(r'^\*\s*'), ''),
+    ('dirty', re.compile(r'\s*\*' + DIVIDER), ''),
+    ('dirty', re.compile(r'\s+\((?:Modified|Unsaved)\)' + DIVIDER, re.IGNORECASE), ''),
+    # Dates and clock times, e.g. meeting windows and media players
+    ('timestamp', re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?\s*/\s*\d{1,2}:\d{2}(?::\d{2})?\b'), ''),
+    ('timestamp', re.compile(r'\b\d{4}-\d{2}-\d{2}(?:[ T]\d{1,2}:\d{2}(?::\d{2})?)?\b'), ''),
+    ('timestamp', re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b'), ''),
+    ('timestamp', re.compile(r'\b\d{1,2}:\d{2}(?::\d{2})?(?:\s?[AaPp][Mm])?\b'), ''),
+    ('whitespace', re.compile(r'\s{2,}'), ' '),
+    # Dividers left around a removed part: "Song - - Spotify", "- Zoom"
+    ('whitespace', re.compile(r'(\s[-–—|])(?:\s+[-–—|])+(?=\s|$)'), r'\1'),
+    ('whitespace', re.compile(r'^\s*[-–—|]\s+'), ''),
+]
+RULE_NAMES = tuple(dict.fromkeys(name for name, _, _ in RULES))
+ENABLED_RULES = [name.strip() for name in os.environ.get('APPUSAGE_TITLE_RULES', ','.join(RULE_NAMES)).split(',')]
+
+_active = [(pattern, replacement) for name, pattern, replacement in RULES if name in ENABLED_RULES]
+
+
+def set_rules(names):
+    """Apply only the named rules from now on."""
+    global _active
+    _active = [(pattern, replacement) for name, pattern, replacement in RULES if name in names]
+    normalize_title.cache_clear()
+
+
+@lru_cache(maxsize=8192)
+def normalize_title(title):
+    """Title without unread counters, dirty markers and clocks; idempotent.
+
+    >>> normalize_title('(3) (4) Inbox - Outlook')
+    'Inbox - Outlook'
+    >>> normalize_title('* * notes.txt - Notepad')
+    'notes.txt - Notepad'
+    >>> normalize_title('- - Zoom')
+    'Zoom'
+    >>> normalize_title('● (2) reddit - Brave')
+    'reddit - Brave'
+    >>> titles = ['(3) (4) Inbox - Outlook', '- - Zoom', '* * notes.txt - Notepad',
+    ...           '● app.py ● - VSCode', 'Meeting 10:30 AM - - Zoom', '[2] (5) Slack', '(3)']
+    >>> all(normalize_title(normalize_title(t)) == normalize_title(t) for t in titles)
+    True
+    """
+    if not title:
+        return title
+    text = title
+    # One rule can expose another match ("(3) (4) Inbox"), so passes repeat until the
+    # title stops changing
+    while True:
+        previous = text
+        for pattern, replacement in _active:
+            text = pattern.sub(replacement, text)
+        text = text.strip()
+        if text == previous:
+            break
+    # A title that was nothing but a counter or a clock stays as it was
+    return text or title
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Normalize the window titles already in a database.')
+    parser.add_argument('--db', help='database file (default: the app database)')
+    parser.add_argument('--dry-run', action='store_true', help='only report the cardinality reduction')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import database  # imported here: database imports this module for its write path
+    if args.db:
+        database.DB_NAME = args.db
+    database.init_db()
+    report = database.normalize_existing_titles(dry_run=args.dry_run)
+    def change(before, after):
+        return f'{before} -> {after} ({(before - after) / before * 100 if before else 0:.1f}% fewer)'
+    print(f"Distinct titles in use:      {change(report['titles_before'], report['titles_after'])}")
+    print(f"Distinct (app, title) pairs: {change(report['pairs_before'], report['pairs_after'])}")
+    if args.dry_run:
+        print('Dry run, nothing was changed.')
+    else:
+        print(f"Titles linked to a normalized title: {report['titles_updated']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,169 @@
-from win10toast import ToastNotifier
-import tkinter as tk
-from tkinter import messagebox
+"""Limit alerts, delivered off the tracker thread.
 
-def show_alert(app_name, duration, max_minutes):
-    message = f"Time limit reached for {app_name}!\nUsed: {duration:.1f} min / Limit: {max_minutes} min."
-    try:
-        toaster = ToastNotifier()
-        toaster.show_toast("App Usage Alert", message, duration=5, threaded=True)
-    except Exception:
-        # Fallback to Tkinter messagebox
+show_alert() is the tracker's alert_callback. It only queues the alert; a single worker
+thread formats it and hands it to the first backend that manages to show it. Alerts for
+the same app within DEDUP_SECONDS are dropped, delivery is limited to RATE_LIMIT alerts
+per window, and when the bounded queue is full new alerts are dropped rather than
+making the caller wait.
+
+Backends are objects with ``notify(title, message)`` that raise when they cannot show
+anything. APPUSAGE_NOTIFIER picks and orders them (default "toast,messagebox,print").
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+QUEUE_SIZE = 32
+DEDUP_SECONDS = 300
+RATE_LIMIT = (3, 60)  # at most 3 alerts per 60 seconds
+NOTIFIER_BACKENDS = os.environ.get('APPUSAGE_NOTIFIER', 'toast,messagebox,print')
+
+
+def format_alert(app_name, duration, max_minutes):
+    return "App Usage Alert", f"Time limit reached for {app_name}!\nUsed: {duration:.1f} min / Limit: {max_minutes} min."
+
+
+class ToastBackend:
+    """Windows toast; one ToastNotifier is created on first use and reused."""
+    def __init__(self):
+        self.toaster = None
+
+    def notify(self, title, message):
+        if self.toaster is None:
+            from win10toast import ToastNotifier
+            self.toaster = ToastNotifier()
+        # Blocking is fine on the worker thread, and a reused ToastNotifier
+        # cannot show a second toast while one is still up
+        self.toaster.show_toast(title, message, duration=5, threaded=False)
+
+
+class MessageBoxBackend:
+    """Tkinter warning box. It is modal, but only the notification worker waits on it."""
+    def notify(self, title, message):
+        import tkinter as tk
+        from tkinter import messagebox
         root = tk.Tk()
         root.withdraw()
-        messagebox.showwarning("App Usage Alert", message)
-        root.destroy() 
\ No newline at end of file
+        try:
+            messagebox.showwarning(title, message)
+        finally:
+            root.destroy()
+
+
+class PrintBackend:
+    """Last resort for headless installs."""
+    def notify(self, title, message):
+        print(f"{title}: {message}", flush=True)
+
+
+class RecordingBackend:
+    """Keeps (title, message) pairs instead of showing them, for tests."""
+    def __init__(self):
+        self.alerts = []
+
+    def notify(self, title, message):
+        self.alerts.append((title, message))
+
+
+BACKENDS = {
+    'toast': ToastBackend,
+    'messagebox': MessageBoxBackend,
+    'print': PrintBackend,
+    'record': RecordingBackend,
+}
+
+
+def default_backends():
+    return [BACKENDS[name.strip()]() for name in NOTIFIER_BACKENDS.split(',') if name.strip() in BACKENDS]
+
+
+class NotificationWorker:
+    def __init__(self, backends=None, queue_size=QUEUE_SIZE, dedup_seconds=DEDUP_SECONDS, rate_limit=RATE_LIMIT):
+        self.backends = backends if backends is not None else default_backends()
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dedup_seconds = dedup_seconds
+        self.rate_limit = rate_limit
+        self.lock = threading.Lock()
+        self.last_alert = {}  # app_name -> monotonic time of the last accepted alert
+        self.delivered_at = deque()
+        self.thread = None
+        self.counts = {'queued': 0, 'delivered': 0, 'duplicate': 0, 'dropped': 0, 'failed': 0}
+
+    def submit(self, app_name, duration, max_minutes):
+        """Queue an alert without blocking. Returns False if it was deduplicated or dropped."""
+        now = time.monotonic()
+        with self.lock:
+            last = self.last_alert.get(app_name)
+            if last is not None and now - last < self.dedup_seconds:
+                self.counts['duplicate'] += 1
+                return False
+            try:
+                self.queue.put_nowait((app_name, duration, max_minutes))
+            except queue.Full:
+                self.counts['dropped'] += 1
+                return False
+            self.last_alert[app_name] = now
+            self.counts['queued'] += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+        return True
+
+    def _wait_for_rate_limit(self):
+        limit, window = self.rate_limit
+        while True:
+            now = time.monotonic()
+            while self.delivered_at and now - self.delivered_at[0] >= window:
+                self.delivered_at.popleft()
+            if len(self.delivered_at) < limit:
+                return
+            time.sleep(window - (now - self.delivered_at[0]))
+
+    def _run(self):
+        while True:
+            alert = self.queue.get()
+            try:
+                self._wait_for_rate_limit()
+                title, message = format_alert(*alert)
+                for backend in self.backends:
+                    try:
+                        backend.notify(title, message)
+                    except Exception:
+                        continue
+                    self.delivered_at.append(time.monotonic())
+                    with self.lock:
+                        self.counts['delivered'] += 1
+                    break
+                else:
+                    with self.lock:
+                        self.counts['failed'] += 1
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        """Wait until every queued alert has been handled."""
+        self.queue.join()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+        stats['pending'] = self.queue.qsize()
+        return stats
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = NotificationWorker()
+        return _worker
+
+
+def show_alert(app_name, duration, max_minutes):
+    get_worker().submit(app_name, duration, max_minutes)
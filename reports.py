@@ -0,0 +1,125 @@
+"""Long-range reports computed in parallel over monthly shards.
+
+A report over years of rows is one large GROUP BY that SQLite runs on a single core.
+ReportExecutor splits the date range into calendar months, runs the same partial
+aggregation for each month in a process pool, each worker with its own read-only
+connection, and sums the partial results. Months are independent and the partials are
+small (one row per app, or per app and week), so the merge is cheap and the speedup
+follows the number of cores until the disk becomes the limit.
+
+APPUSAGE_REPORT_PROCESSES sets the pool size (default: one per core); with 1 the shards
+run in the calling process. ``python benchmark.py --parallel`` compares both.
+"""
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from itertools import repeat
+from pathlib import Path
+
+import database
+
+REPORT_PROCESSES = int(os.environ.get('APPUSAGE_REPORT_PROCESSES', os.cpu_count() or 1))
+
+# Partial aggregation of one shard, taking its [start, end) bounds. Rows are group
+# columns followed by minutes; the partials of all shards are summed per group.
+SHARD_QUERIES = {
+    'top_apps': '''
+        SELECT app_id, SUM(duration) FROM usage_facts
+        WHERE start_time >= ? AND start_time < ?
+        GROUP BY app_id
+    ''',
+    'usage_by_week': '''
+        SELECT strftime('%Y-%W', start_time) AS week, app_id, SUM(duration) FROM usage_facts
+        WHERE start_time >= ? AND start_time < ?
+        GROUP BY week, app_id
+    ''',
+}
+
+
+def month_shards(start_date, end_date):
+    """[start, end) 'YYYY-MM-DD' bounds of every calendar month in a date range
+    (inclusive), clipped to the range."""
+    first = date.fromisoformat(start_date)
+    stop = date.fromisoformat(end_date) + timedelta(days=1)
+    shards = []
+    while first < stop:
+        next_month = (first.replace(day=1) + timedelta(days=32)).replace(day=1)
+        shards.append((str(first), str(min(next_month, stop))))
+        first = next_month
+    return shards
+
+
+def read_only_connection(path):
+    return sqlite3.connect(Path(path).resolve().as_uri() + '?mode=ro', uri=True)
+
+
+def run_shard(path, kind, start, end):
+    """One partial aggregation; runs in a worker process."""
+    conn = read_only_connection(path)
+    try:
+        return conn.execute(SHARD_QUERIES[kind], (start, end)).fetchall()
+    finally:
+        conn.close()
+
+
+def merge(partials):
+    """Sum the minutes of partial results per group: {(group columns): minutes}."""
+    totals = {}
+    for rows in partials:
+        for row in rows:
+            key = row[:-1]
+            totals[key] = totals.get(key, 0) + (row[-1] or 0)
+    return totals
+
+
+class ReportExecutor:
+    def __init__(self, processes=REPORT_PROCESSES, path=None):
+        self.path = path or database.DB_NAME
+        self.processes = processes
+        self.pool = ProcessPoolExecutor(max_workers=processes) if processes > 1 else None
+
+    def _merged(self, kind, start_date, end_date):
+        shards = month_shards(start_date, end_date)
+        if not shards:
+            return {}
+        starts, ends = zip(*shards)
+        if self.pool is None:
+            partials = map(run_shard, repeat(self.path), repeat(kind), starts, ends)
+        else:
+            partials = self.pool.map(run_shard, repeat(self.path), repeat(kind), starts, ends)
+        return merge(partials)
+
+    def _app_names(self):
+        conn = read_only_connection(self.path)
+        try:
+            return dict(conn.execute('SELECT id, name FROM apps').fetchall())
+        finally:
+            conn.close()
+
+    def top_apps(self, start_date, end_date, limit=5):
+        """(app_name, minutes) of the most used apps between two dates (inclusive)."""
+        totals = self._merged('top_apps', start_date, end_date)
+        names = self._app_names()
+        rows = [(names.get(app_id), minutes) for (app_id,), minutes in totals.items()]
+        rows.sort(key=lambda row: -row[1])
+        return rows[:limit]
+
+    def usage_by_week(self, start_date, end_date):
+        """(week, app_name, minutes) rows like database.get_usage_by_week."""
+        totals = self._merged('usage_by_week', start_date, end_date)
+        names = self._app_names()
+        rows = [(week, names.get(app_id), minutes) for (week, app_id), minutes in totals.items()]
+        rows.sort(key=lambda row: (row[0], -row[2]))
+        return rows
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
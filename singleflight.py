@@ -0,0 +1,53 @@
+"""Coalesce concurrent identical computations and cap how many run at once.
+
+Used by the web API for heavy reports: requests that arrive while the same report is
+being computed wait for that computation and share its result, and distinct reports
+run on a small thread pool so a burst of requests cannot saturate SQLite or the CPU.
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class Busy(Exception):
+    """Too many distinct computations are already running or queued."""
+
+
+class SingleFlight:
+    def __init__(self, max_workers=2, max_pending=16):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='report')
+        self.max_pending = max_pending
+        # Reentrant: a future that is already done runs its callback inside submit's lock
+        self.lock = threading.RLock()
+        self.inflight = {}  # key -> Future
+        self.counts = {'started': 0, 'coalesced': 0, 'rejected': 0}
+
+    def _forget(self, key, future):
+        with self.lock:
+            if self.inflight.get(key) is future:
+                del self.inflight[key]
+
+    def run(self, key, fn, *args):
+        """Return fn(*args), sharing one call among concurrent callers with the same key.
+
+        Exceptions from fn are raised in every waiting caller. Raises Busy instead of
+        queueing when max_pending distinct keys are already in flight.
+        """
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is not None:
+                self.counts['coalesced'] += 1
+            else:
+                if len(self.inflight) >= self.max_pending:
+                    self.counts['rejected'] += 1
+                    raise Busy(f'{len(self.inflight)} reports already in progress')
+                future = self.executor.submit(fn, *args)
+                self.inflight[key] = future
+                self.counts['started'] += 1
+                future.add_done_callback(lambda f: self._forget(key, f))
+        return future.result()
+
+    def get_stats(self):
+        with self.lock:
+            stats = dict(self.counts)
+            stats['in_flight'] = len(self.inflight)
+        return stats
@@ -0,0 +1,194 @@
+"""Which website a browser window is showing, from its title.
+
+Browsers do not put the URL in the window title, but many titles contain a host name
+("localhost:8000 - Google Chrome", "Amazon.com: Books") or end with the site's name
+("Video - YouTube - Google Chrome"). extract_site() looks for both:
+
+1. host-like tokens, resolved against a reverse-label trie of KNOWN_SITES, so
+   "m.youtube.com" is youtube.com and "docs.google.com" is not google.com. A host
+   that is not known is reported as its registrable domain ("blog.example.org" is
+   example.org) if its top-level domain is a common one; "app.py" is not a host.
+2. divider-separated parts of the title equal to a known site name ("YouTube",
+   "Stack Overflow"), last part first, also after stripping unread counters and
+   markers ("(3) Facebook"; see normalize.py).
+
+Sites are reported by domain. The trie is built once at import and results are
+memoized per title, so the tracker can call extract_site() on every tick.
+
+Sites recorded under other names by older versions (e.g. "youtube") are renamed with
+``python sites.py``. The examples in extract_site() run with ``python -m doctest sites.py``.
+"""
+import argparse
+import re
+from functools import lru_cache
+
+from normalize import normalize_title
+
+# (domain, category, site names as they appear in titles), categories as in webapp
+KNOWN_SITES = [
+    ('youtube.com', 'Distracting', ('youtube',)),
+    ('instagram.com', 'Distracting', ('instagram',)),
+    ('facebook.com', 'Distracting', ('facebook',)),
+    ('twitter.com', 'Distracting', ('twitter',)),
+    ('x.com', 'Distracting', ()),
+    ('reddit.com', 'Distracting', ('reddit',)),
+    ('tiktok.com', 'Distracting', ('tiktok',)),
+    ('netflix.com', 'Distracting', ('netflix',)),
+    ('discord.com', 'Distracting', ('discord',)),
+    ('pinterest.com', 'Distracting', ('pinterest',)),
+    ('tumblr.com', 'Distracting', ('tumblr',)),
+    ('twitch.tv', 'Distracting', ('twitch',)),
+    ('roblox.com', 'Distracting', ('roblox',)),
+    ('primevideo.com', 'Distracting', ('prime video',)),
+    ('linkedin.com', 'Distracting', ('linkedin',)),
+    ('quora.com', 'Distracting', ('quora',)),
+    ('9gag.com', 'Distracting', ('9gag',)),
+    ('bilibili.com', 'Distracting', ('bilibili',)),
+    ('vk.com', 'Distracting', ('vk',)),
+    ('weibo.com', 'Distracting', ('weibo',)),
+    ('imgur.com', 'Distracting', ('imgur',)),
+    ('kick.com', 'Distracting', ('kick',)),
+    ('github.com', 'Productive', ('github',)),
+    ('gitlab.com', 'Productive', ('gitlab',)),
+    ('stackoverflow.com', 'Productive', ('stack overflow',)),
+    ('docs.google.com', 'Productive', ('google docs', 'google sheets', 'google slides')),
+    ('mail.google.com', 'Productive', ('gmail',)),
+    ('calendar.google.com', 'Productive', ('google calendar',)),
+    ('drive.google.com', 'Productive', ('google drive',)),
+    ('notion.so', 'Productive', ('notion',)),
+    ('trello.com', 'Productive', ('trello',)),
+    ('atlassian.net', 'Productive', ('jira', 'confluence')),
+    ('slack.com', 'Productive', ('slack',)),
+    ('teams.microsoft.com', 'Productive', ('microsoft teams',)),
+    ('outlook.office.com', 'Productive', ('outlook',)),
+    ('figma.com', 'Productive', ('figma',)),
+    ('developer.mozilla.org', 'Productive', ('mdn web docs',)),
+    ('localhost', 'Productive', ()),
+    ('music.youtube.com', 'Others', ('youtube music',)),
+    ('google.com', 'Others', ('google search',)),
+    ('wikipedia.org', 'Others', ('wikipedia',)),
+    ('amazon.com', 'Others', ('amazon',)),
+]
+
+# Top-level domains accepted for hosts that are not known. Country codes that are also
+# common file extensions (py, md, rs, sh, pl...) are left out on purpose.
+TLDS = set('''
+    com org net io dev app ai co edu gov info biz me tv gg xyz site online tech blog news
+    uk de fr nl es it se no fi dk cz at ch be ie eu ca us au nz in jp cn kr br mx ru ua
+'''.split())
+# Suffixes under which domains are registered one label deeper (bbc.co.uk)
+SECOND_LEVEL = {'co.uk', 'org.uk', 'ac.uk', 'gov.uk', 'com.au', 'net.au', 'org.au', 'co.nz',
+                'co.jp', 'ne.jp', 'com.br', 'co.in', 'com.cn', 'co.kr', 'com.mx'}
+
+BROWSER_SUFFIX = re.compile(r'\s+[-–—]\s+(?:Google Chrome|Chromium|Mozilla Firefox|Firefox|'
+                            r'Microsoft\u200b?\s*Edge|Brave|Opera|Vivaldi)\s*$', re.IGNORECASE)
+HOST = re.compile(r'(?<![\w@.-])((?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,24}|localhost)(?::\d+)?(?![\w-])',
+                  re.IGNORECASE)
+DIVIDER = re.compile(r'\s+[-–—|·•]\s+')
+
+_END = ''  # trie key of the domain ending at a node; labels are never empty
+
+
+def _compile(known):
+    trie = {}
+    names = {}
+    categories = {}
+    for domain, category, aliases in known:
+        node = trie
+        for label in reversed(domain.split('.')):
+            node = node.setdefault(label, {})
+        node[_END] = domain
+        categories[domain] = category
+        for alias in aliases:
+            names[alias] = domain
+    return trie, names, categories
+
+
+_trie, _names, _categories = _compile(KNOWN_SITES)
+
+
+def resolve_host(host):
+    """Site for a host name: the longest known domain containing it, else its registrable
+    domain; None if it does not look like a public host."""
+    labels = host.lower().rstrip('.').split('.')
+    node = _trie
+    site = None
+    for label in reversed(labels):
+        node = node.get(label)
+        if node is None:
+            break
+        site = node.get(_END, site)
+    if site is not None:
+        return site
+    if len(labels) < 2 or labels[-1] not in TLDS:
+        return None
+    depth = 3 if len(labels) > 2 and '.'.join(labels[-2:]) in SECOND_LEVEL else 2
+    return '.'.join(labels[-depth:])
+
+
+def _match_page(page):
+    for host in HOST.findall(page):
+        site = resolve_host(host)
+        if site is not None:
+            return site
+    for part in reversed(DIVIDER.split(page)):
+        site = _names.get(part.strip().lower())
+        if site is not None:
+            return site
+    return None
+
+
+@lru_cache(maxsize=4096)
+def extract_site(title):
+    """Domain of the site shown in a browser window title, or None.
+
+    >>> extract_site('Video - YouTube - Google Chrome')
+    'youtube.com'
+    >>> extract_site('(3) Facebook - Google Chrome')
+    'facebook.com'
+    >>> extract_site('(12) YouTube - Mozilla Firefox')
+    'youtube.com'
+    >>> extract_site('app.py - VSCode') is None
+    True
+    """
+    if not title:
+        return None
+    page = BROWSER_SUFFIX.sub('', title)
+    # Unread counters and markers ("(3) Facebook") hide the site name from the divider
+    # match; the raw page goes first because normalizing also drops "•" dividers
+    return _match_page(page) or _match_page(normalize_title(page))
+
+
+def site_category(site):
+    """Category of a known site ('Productive', 'Distracting' or 'Others'), else None."""
+    return _categories.get(site)
+
+
+def canonical_site(name):
+    """Domain for a site name stored by an older version ("youtube", "youtube.com")."""
+    return _names.get(name.strip().lower()) or resolve_host(name.strip())
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Rename the sites already in a database to their domains.')
+    parser.add_argument('--db', help='database file (default: the app database)')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be renamed')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    import database  # imported here: database imports this module through categories
+    if args.db:
+        database.DB_NAME = args.db
+    database.init_db()
+    report = database.rename_sites(canonical_site, dry_run=args.dry_run)
+    for old, new in sorted(report['renamed'].items()):
+        print(f'{old} -> {new}')
+    print(f"Sites renamed: {len(report['renamed'])}, website rows updated: {report['rows_updated']}")
+    if args.dry_run:
+        print('Dry run, nothing was changed.')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,38 +1,99 @@
 import time
 import threading
-import win32gui
-import win32process
+from collections import deque
 import psutil
 from datetime import datetime
-from database import insert_usage_log, get_limit, log_website_usage
+from database import insert_usage_log, get_limits, limit_name, log_website_usage
 from utils import get_friendly_app_name
+from normalize import normalize_title
+from sites import extract_site
+import metrics
+import journal
+
+# How often app limits set from a frontend reach the tracker
+LIMITS_REFRESH_SECONDS = 5
 
-DISTRACTING_SITES = [
-    'youtube.com', 'youtube', 'instagram', 'facebook.com', 'facebook', 'twitter.com', 'twitter',
-    'reddit.com', 'reddit', 'tiktok.com', 'tiktok', 'netflix.com', 'netflix', 'discord.com', 'discord',
-    'pinterest.com', 'pinterest', 'tumblr.com', 'tumblr', 'twitch.tv', 'twitch', 'roblox.com', 'roblox',
-    'primevideo.com', 'prime video', 'linkedin.com', 'linkedin', 'quora.com', 'quora', '9gag.com', '9gag',
-    'bilibili.com', 'bilibili', 'vk.com', 'vk', 'weibo.com', 'weibo', 'imgur.com', 'imgur', 'kick.com', 'kick',
-]
 BROWSER_PROCESSES = ['chrome.exe', 'msedge.exe', 'firefox.exe', 'brave.exe', 'opera.exe', 'opera_gx.exe', 'vivaldi.exe']
 
+def _summary(values):
+    """last/p50/p95/max in milliseconds for a sequence of durations in seconds."""
+    if not values:
+        return {'last': None, 'p50': None, 'p95': None, 'max': None}
+    ordered = sorted(values)
+    def pick(pct):
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100.0))] * 1000.0, 3)
+    return {'last': round(values[-1] * 1000.0, 3), 'p50': pick(50), 'p95': pick(95), 'max': round(ordered[-1] * 1000.0, 3)}
+
+class TickStats:
+    """Loop health counters for the tracker thread, kept for the most recent ticks."""
+    def __init__(self, window=600):
+        self.lock = threading.Lock()
+        self.ticks = 0
+        self.missed_deadlines = 0
+        self.db_writes = 0
+        self.tick_times = deque(maxlen=window)
+        self.introspect_times = deque(maxlen=window)
+        self.write_times = deque(maxlen=window)
+        self.drifts = deque(maxlen=window)
+        self.max_drift = 0.0
+
+    def record(self, tick, introspect, write, writes, drift, missed):
+        with self.lock:
+            self.ticks += 1
+            self.db_writes += writes
+            self.missed_deadlines += missed
+            self.tick_times.append(tick)
+            self.introspect_times.append(introspect)
+            self.write_times.append(write)
+            self.drifts.append(drift)
+            self.max_drift = max(self.max_drift, drift)
+
+    def snapshot(self):
+        with self.lock:
+            drifts = list(self.drifts)
+            return {
+                'ticks': self.ticks,
+                'missed_deadlines': self.missed_deadlines,
+                'db_writes': self.db_writes,
+                'tick_ms': _summary(list(self.tick_times)),
+                'introspect_ms': _summary(list(self.introspect_times)),
+                'db_write_ms': _summary(list(self.write_times)),
+                'drift_ms': {
+                    'last': round(drifts[-1] * 1000.0, 3) if drifts else None,
+                    'mean': round(sum(drifts) / len(drifts) * 1000.0, 3) if drifts else None,
+                    'max': round(self.max_drift * 1000.0, 3),
+                },
+            }
+
 class Tracker:
-    def __init__(self, alert_callback=None, poll_interval=1):
+    def __init__(self, alert_callback=None, poll_interval=1, switch_callback=None):
         self.running = False
         self.thread = None
         self.current_app = None
         self.current_title = None
         self.start_time = None
         self.alert_callback = alert_callback
+        self.switch_callback = switch_callback  # called with (app_name, title, start_time) on window change
         self.poll_interval = poll_interval
         self.app_exe_map = {}  # app_name -> exe_path
         self.current_site = None
         self.site_start_time = None
         self.alerts_shown = set()  # Track which apps have already shown alerts today
         self.last_flush_time = None
+        self.stats = TickStats()
+        self._tick_write_time = 0.0
+        self._tick_writes = 0
+        self.journal = None  # EventJournal while running, unless journaling is off or busy
+        # limit_name -> max minutes, reloaded by _limits_loop so ticks never query the database
+        self.limits = {}
+        self._limits_stop = threading.Event()
+        self._limits_thread = None
 
     def _get_active_window_info(self):
         try:
+            # Imported lazily so the tracker module (and the web API) load without pywin32
+            import win32gui
+            import win32process
             hwnd = win32gui.GetForegroundWindow()
             if not hwnd:
                 return None, None, None
@@ -53,7 +114,7 @@ class Tracker:
             return
         # Use friendly name for limit check
         friendly_name = get_friendly_app_name(exe_path, app_name, window_title)
-        max_minutes = get_limit(friendly_name)
+        max_minutes = self.limits.get(limit_name(friendly_name))
         if max_minutes is not None and current_duration >= max_minutes:
             # Create a unique key for today's alert
             today = datetime.now().strftime('%Y-%m-%d')
@@ -63,27 +124,62 @@ class Tracker:
                     self.alert_callback(friendly_name, current_duration, max_minutes)
                 self.alerts_shown.add(alert_key)
 
+    def refresh_limits(self):
+        # Replaced as a whole, so the tracker thread reads either the old or the new limits
+        self.limits = get_limits()
+
+    def _limits_loop(self):
+        while not self._limits_stop.wait(LIMITS_REFRESH_SECONDS):
+            try:
+                self.refresh_limits()
+            except Exception:
+                # The previous limits stay in force until a reload succeeds
+                pass
+
+    def _log_usage(self, app_name, title, start_time, end_time, duration):
+        started = time.monotonic()
+        if self.journal:
+            self.journal.append_usage(app_name, title, start_time, end_time, duration)
+        else:
+            insert_usage_log(app_name, title, start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+        self._tick_write_time += time.monotonic() - started
+        self._tick_writes += 1
+
+    def _log_site(self, site, browser, start_time, end_time, duration):
+        started = time.monotonic()
+        if self.journal:
+            self.journal.append_website(site, browser, start_time, end_time, duration)
+        else:
+            log_website_usage(site, browser, start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+        self._tick_write_time += time.monotonic() - started
+        self._tick_writes += 1
+
     def _track_loop(self):
         self.last_flush_time = time.time()
+        # Ticks are scheduled against absolute monotonic deadlines so slow ticks do not
+        # push every later tick back.
+        deadline = time.monotonic()
         while self.running:
+            tick_started = time.monotonic()
+            drift = max(0.0, tick_started - deadline)
+            self._tick_write_time = 0.0
+            self._tick_writes = 0
             app_name, window_title, exe_path = self._get_active_window_info()
+            introspect_time = time.monotonic() - tick_started
             now = datetime.now()
             now_ts = time.time()
             
             # Website tracking
             site_found = None
-            if app_name and app_name.lower() in BROWSER_PROCESSES and window_title:
-                for site in DISTRACTING_SITES:
-                    if site.lower() in window_title.lower():
-                        site_found = site
-                        break
+            if app_name and app_name.lower() in BROWSER_PROCESSES:
+                site_found = extract_site(window_title)
             if site_found:
                 if self.current_site != site_found:
                     # Log previous site usage
                     if self.current_site and self.site_start_time:
                         end_time = now
                         duration = (end_time - self.site_start_time).total_seconds() / 60.0
-                        log_website_usage(self.current_site, app_name, self.site_start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+                        self._log_site(self.current_site, app_name, self.site_start_time, end_time, duration)
                     self.current_site = site_found
                     self.site_start_time = now
             else:
@@ -91,7 +187,7 @@ class Tracker:
                 if self.current_site and self.site_start_time:
                     end_time = now
                     duration = (end_time - self.site_start_time).total_seconds() / 60.0
-                    log_website_usage(self.current_site, app_name, self.site_start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+                    self._log_site(self.current_site, app_name, self.site_start_time, end_time, duration)
                     self.current_site = None
                     self.site_start_time = None
             
@@ -99,18 +195,22 @@ class Tracker:
             if app_name and exe_path:
                 self.app_exe_map[app_name] = exe_path
             
-            if app_name != self.current_app or window_title != self.current_title:
+            # Unread counters, dirty markers and clocks in the title are not a window switch;
+            # the interval keeps the raw title it started with (see database.write_usage_rows)
+            if app_name != self.current_app or normalize_title(window_title) != normalize_title(self.current_title):
                 # Log previous app usage
                 if self.current_app and self.start_time:
                     end_time = now
                     duration = (end_time - self.start_time).total_seconds() / 60.0
-                    insert_usage_log(self.current_app, self.current_title, self.start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+                    self._log_usage(self.current_app, self.current_title, self.start_time, end_time, duration)
                 
                 # Start tracking new app
                 self.current_app = app_name
                 self.current_title = window_title
                 self.start_time = now
                 self.last_flush_time = now_ts
+                if self.switch_callback:
+                    self.switch_callback(app_name, window_title, now)
             else:
                 # Same app - check for limit continuously
                 if self.current_app and self.start_time:
@@ -120,25 +220,49 @@ class Tracker:
                     if now_ts - self.last_flush_time >= 10:
                         end_time = now
                         duration = (end_time - self.start_time).total_seconds() / 60.0
-                        insert_usage_log(self.current_app, self.current_title, self.start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+                        self._log_usage(self.current_app, self.current_title, self.start_time, end_time, duration)
                         # Reset start time to now for next interval
                         self.start_time = now
                         self.last_flush_time = now_ts
             
-            time.sleep(self.poll_interval)
+            tick_time = time.monotonic() - tick_started
+            deadline += self.poll_interval
+            missed = 0
+            now_mono = time.monotonic()
+            if now_mono > deadline:
+                # Skip the deadlines we overran instead of firing a burst of catch-up ticks
+                missed = int((now_mono - deadline) // self.poll_interval) + 1
+                deadline += missed * self.poll_interval
+            self.stats.record(tick_time, introspect_time, self._tick_write_time, self._tick_writes, drift, missed)
+            if metrics.ENABLED:
+                metrics.observe('appusage_tracker_tick_seconds', 'tick', tick_time)
+                metrics.observe('appusage_tracker_tick_seconds', 'introspect', introspect_time)
+                metrics.observe('appusage_tracker_tick_seconds', 'db_write', self._tick_write_time)
+            time.sleep(max(0.0, deadline - time.monotonic()))
         
         # On stop, log the last app and last site
         if self.current_app and self.start_time:
             end_time = datetime.now()
             duration = (end_time - self.start_time).total_seconds() / 60.0
-            insert_usage_log(self.current_app, self.current_title, self.start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+            self._log_usage(self.current_app, self.current_title, self.start_time, end_time, duration)
         if self.current_site and self.site_start_time:
             end_time = datetime.now()
             duration = (end_time - self.site_start_time).total_seconds() / 60.0
-            log_website_usage(self.current_site, self.current_app, self.site_start_time.strftime('%Y-%m-%d %H:%M:%S'), end_time.strftime('%Y-%m-%d %H:%M:%S'), duration)
+            self._log_site(self.current_site, self.current_app, self.site_start_time, end_time, duration)
 
     def start(self):
         if not self.running:
+            if journal.JOURNAL_ENABLED and self.journal is None:
+                try:
+                    # Replays anything a previous run left in the journal
+                    self.journal = journal.EventJournal()
+                    self.journal.start()
+                except journal.JournalBusy:
+                    self.journal = None
+            self.refresh_limits()
+            self._limits_stop.clear()
+            self._limits_thread = threading.Thread(target=self._limits_loop, daemon=True)
+            self._limits_thread.start()
             self.running = True
             # Reset alerts for new day
             self.alerts_shown.clear()
@@ -150,9 +274,24 @@ class Tracker:
         if self.thread:
             self.thread.join()
             self.thread = None
+        self._limits_stop.set()
+        if self._limits_thread:
+            self._limits_thread.join()
+            self._limits_thread = None
+        if self.journal:
+            self.journal.close()
+            self.journal = None
 
     def is_running(self):
         return self.running
 
     def get_app_exe_map(self):
-        return self.app_exe_map 
\ No newline at end of file
+        return self.app_exe_map
+
+    def get_stats(self):
+        """Loop health: tick wall time, introspection vs DB write time, drift and missed deadlines."""
+        stats = self.stats.snapshot()
+        stats['running'] = self.running
+        stats['poll_interval'] = self.poll_interval
+        stats['journal'] = self.journal.get_stats() if self.journal else None
+        return stats
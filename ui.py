@@ -1,18 +1,15 @@
 import customtkinter as ctk
 from tkinter import messagebox, simpledialog
-from tracker import Tracker
+from daemon import connect_tracker, release_tracker
 from notifier import show_alert
-from database import init_db, get_usage_today, set_limit, get_top_used_apps, get_latest_window_titles, get_website_usage_today, get_usage_by_day, get_usage_by_week, get_website_usage_by_day, get_website_usage_by_week, get_usage_by_hour, get_website_usage_by_hour
+from database import init_db, get_usage_today, set_limit, get_top_used_apps, get_website_usage_today, get_usage_by_day, get_usage_by_week, get_website_usage_by_day, get_website_usage_by_week
+from database import get_category_series, get_display_names
 from PIL import Image, ImageTk
 import os
 import sys
-import matplotlib
-matplotlib.use('Agg')
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import calendar
 from datetime import datetime, timedelta
-from utils import get_friendly_app_name
+from aggregation import category_series, range_buckets, CATEGORIES
 
 if sys.platform == "win32":
     import ctypes
@@ -20,7 +17,7 @@ if sys.platform == "win32":
 
     def extract_icon_from_exe(exe_path, size=(32, 32)):
         try:
-            import win32api, win32con, win32ui
+            import win32api, win32con, win32gui, win32ui
             large, small = win32gui.ExtractIconEx(exe_path, 0)
             if large:
                 hicon = large[0]
@@ -58,7 +55,7 @@ class AppUI:
         self.root.title("App Usage Monitor")
         ctk.set_appearance_mode("dark")
         ctk.set_default_color_theme("dark-blue")
-        self.tracker = Tracker(alert_callback=show_alert)
+        self.tracker = connect_tracker(alert_callback=show_alert)
         self.icon_cache = {}  # exe_path -> PhotoImage
         self.create_widgets()
         self.update_usage_table()
@@ -208,7 +205,7 @@ class AppUI:
         elif self.period_var.get() == "Last Month":
             usage = get_usage_by_week(str(start), str(end))
         exe_map = self.tracker.get_app_exe_map()
-        latest_titles = get_latest_window_titles()
+        display_names = get_display_names()
         friendly_map = {}
         new_keys = set()
         if not hasattr(self, 'usage_rows'):
@@ -227,8 +224,8 @@ class AppUI:
         for idx, (app, minutes) in enumerate(sorted(app_totals.items(), key=lambda x: -x[1])):
             app_norm = app.lower().replace('.exe', '')
             exe_path = exe_map.get(app)
-            window_title = latest_titles.get(app)
-            friendly_name = get_friendly_app_name(exe_path, app, window_title)
+            # Same names as the dashboard, stored when the app's latest title changes
+            friendly_name = display_names.get(app, app)
             friendly_norm = friendly_name.lower().replace('.exe', '')
             if app_norm in NORMALIZED_IGNORE_APPS or friendly_norm in NORMALIZED_IGNORE_APPS:
                 continue
@@ -292,7 +289,7 @@ class AppUI:
             for week, site, minutes in usage:
                 site_totals[site] = site_totals.get(site, 0) + minutes
         for idx, (site, minutes) in enumerate(sorted(site_totals.items(), key=lambda x: -x[1])):
-            site_display = site.capitalize()
+            site_display = site
             new_keys.add(site_display)
             bg = "#23272e" if idx % 2 == 0 else "#181a20"
             if site_display not in self.website_rows:
@@ -318,40 +315,23 @@ class AppUI:
                 del self.website_rows[key]
 
     def update_stats_charts(self, in_place=False):
-        from database import get_usage_by_hour, get_usage_by_day, get_usage_by_week, get_website_usage_by_hour, get_website_usage_by_day, get_website_usage_by_week
         today = datetime.now().date()
         start, end = self.get_period_dates()
         period = self.period_var.get()
-        DISTRACTING = set(["youtube", "instagram", "facebook", "twitter", "reddit", "tiktok", "netflix", "discord", "pinterest", "tumblr", "twitch", "roblox", "prime video", "quora", "9gag", "bilibili", "vk", "weibo", "imgur", "kick", "onlyfans"])
-        PRODUCTIVE = set(["notion", "vscode", "pycharm", "word", "excel", "onenote", "outlook", "teams", "slack", "zoom", "google docs", "google sheets", "github desktop"])
 
         if period == "Today":
             # Hourly
-            app_data = get_usage_by_hour(str(today))
-            web_data = get_website_usage_by_hour(str(today))
-            x_labels = [f"{h:02d}" for h in range(24)]
-            x_type = "hour"
+            granularity = "hour"
+            bucket_keys = range_buckets(start, end, granularity)
+            x_labels = [key[-2:] for key in bucket_keys]
         elif period == "Last Week":
-            app_data = get_usage_by_day(str(start), str(end))
-            web_data = get_website_usage_by_day(str(start), str(end))
-            num_days = (end - start).days + 1
-            x_labels = [(start + timedelta(days=i)).strftime("%a") for i in range(num_days)]
-            x_keys = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(num_days)]
-            x_type = "day"
+            granularity = "day"
+            bucket_keys = range_buckets(start, end, granularity)
+            x_labels = [(start + timedelta(days=i)).strftime("%a") for i in range(len(bucket_keys))]
         elif period == "Last Month":
-            app_data = get_usage_by_week(str(start), str(end))
-            web_data = get_website_usage_by_week(str(start), str(end))
-            # Get all week labels in range
-            from datetime import date
-            def week_label(dt):
-                return dt.strftime("%Y-%W")
-            week_set = set()
-            cur = start
-            while cur <= end:
-                week_set.add(week_label(cur))
-                cur += timedelta(days=7)
-            x_labels = sorted(list(week_set))
-            x_type = "week"
+            granularity = "week"
+            bucket_keys = range_buckets(start, end, granularity)
+            x_labels = [max(datetime.strptime(key, "%Y-%m-%d").date(), start).strftime("%Y-%W") for key in bucket_keys]
         else:
             # fallback: clear chart
             self.bar_canvas.delete("all")
@@ -359,63 +339,9 @@ class AppUI:
             self.usage_range_label.configure(text="")
             return
 
-        # Prepare data structure
-        if period == "Today":
-            data = {h: {"Distracting": 0, "Productive": 0, "Others": 0} for h in x_labels}
-            for hour, app, minutes in app_data:
-                cat = "Others"
-                app_lower = app.lower()
-                if any(site in app_lower for site in DISTRACTING):
-                    cat = "Distracting"
-                elif any(site in app_lower for site in PRODUCTIVE):
-                    cat = "Productive"
-                data[hour][cat] += minutes
-            for hour, site, minutes in web_data:
-                cat = "Others"
-                site_lower = site.lower()
-                if any(s in site_lower for s in DISTRACTING):
-                    cat = "Distracting"
-                elif any(s in site_lower for s in PRODUCTIVE):
-                    cat = "Productive"
-                data[hour][cat] += minutes
-        elif period == "Last Week":
-            data = {d: {"Distracting": 0, "Productive": 0, "Others": 0} for d in x_keys}
-            for day, app, minutes in app_data:
-                cat = "Others"
-                app_lower = app.lower()
-                if any(site in app_lower for site in DISTRACTING):
-                    cat = "Distracting"
-                elif any(site in app_lower for site in PRODUCTIVE):
-                    cat = "Productive"
-                data[day][cat] += minutes
-            for day, site, minutes in web_data:
-                cat = "Others"
-                site_lower = site.lower()
-                if any(s in site_lower for s in DISTRACTING):
-                    cat = "Distracting"
-                elif any(s in site_lower for s in PRODUCTIVE):
-                    cat = "Productive"
-                data[day][cat] += minutes
-        elif period == "Last Month":
-            data = {w: {"Distracting": 0, "Productive": 0, "Others": 0} for w in x_labels}
-            for week, app, minutes in app_data:
-            cat = "Others"
-            app_lower = app.lower()
-            if any(site in app_lower for site in DISTRACTING):
-                cat = "Distracting"
-            elif any(site in app_lower for site in PRODUCTIVE):
-                cat = "Productive"
-                data[week][cat] += minutes
-            for week, site, minutes in web_data:
-            cat = "Others"
-            site_lower = site.lower()
-            if any(s in site_lower for s in DISTRACTING):
-                cat = "Distracting"
-            elif any(s in site_lower for s in PRODUCTIVE):
-                cat = "Productive"
-                data[week][cat] += minutes
-        else:
-            data = {}
+        # Minutes per bucket and stored category, from the category rollups
+        series = category_series(get_category_series(str(start), str(end), granularity), bucket_keys).tolist()
+        data = {key: dict(zip(CATEGORIES, values)) for key, values in zip(bucket_keys, series)}
 
         # Draw chart
         self.bar_canvas.delete("all")
@@ -424,9 +350,8 @@ class AppUI:
         x0 = 18
         max_minutes = max((sum(data[k][cat] for cat in data[k]) for k in data), default=1)
         colors = {"Distracting": "#f59e42", "Productive": "#4ade80", "Others": "#9ca3af"}
-        for i, k in enumerate(x_labels):
+        for i, (key, k) in enumerate(zip(bucket_keys, x_labels)):
             y = 130
-            key = k if period == "Today" else (x_keys[i] if period == "Last Week" else k)
             for cat in ["Others", "Productive", "Distracting"]:
                 v = data.get(key, {cat: 0}).get(cat, 0)
                 hh = int(110 * v / max_minutes) if max_minutes > 0 else 0
@@ -463,7 +388,10 @@ def main():
     init_db()
     root = ctk.CTk()
     app = AppUI(root)
-    root.mainloop()
+    try:
+        root.mainloop()
+    finally:
+        release_tracker(app.tracker)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,4 +1,6 @@
 import os
+import re
+from functools import lru_cache
 
 BROWSER_MAP = {
     'chrome.exe': 'Google Chrome',
@@ -67,4 +69,18 @@ def get_friendly_app_name(exe_path, fallback, window_title=None):
     # Fallback: prettify the process name
     if fallback_l.endswith('.exe'):
         return fallback_l.replace('.exe', '').capitalize()
-    return fallback.capitalize() 
\ No newline at end of file
+    return fallback.capitalize() 
+
+# Text after the last divider of a window title: "Inbox - Outlook" is shown as "Outlook"
+TITLE_TAIL = re.compile(r'(.*)[\|\-–—](.+)')
+
+@lru_cache(maxsize=4096)
+def display_name(app_name, window_title=None):
+    """Name an app is reported under, from its latest window title (else its process
+    name). Stored in apps.display_name by the write path when the latest title changes."""
+    if window_title and window_title.strip():
+        match = TITLE_TAIL.search(window_title)
+        if match:
+            return match.group(2).strip().title()
+        return window_title.strip().title()
+    return app_name.title()
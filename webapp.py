@@ -1,52 +1,134 @@
-from flask import Flask, render_template_string, jsonify, request
+from flask import Flask, Response, render_template_string, jsonify, request, g, stream_with_context
+from flask.json.provider import DefaultJSONProvider
+import time
 import threading
-import webview
 from datetime import datetime, timedelta
 import os
-import pystray
-from PIL import Image
-import re
-import sqlite3
+import csv
+import io
+import json
+import zlib
+import base64
 
 # Import your database functions
-from database import get_usage_by_hour, get_usage_by_day, get_usage_by_week, get_website_usage_by_hour, get_website_usage_by_day, get_website_usage_by_week
-from database import get_usage_today, get_usage_by_day as get_usage_by_day_flat, get_usage_by_week as get_usage_by_week_flat
-from database import get_latest_window_titles
-# Assume you have a Tracker class or similar
-from tracker import Tracker
+from database import get_connection, iter_export_rows, EXPORT_QUERIES, ingest_batch, get_app_names, get_query_cache_stats, search_titles
+from database import get_category_minutes, epoch_hour, get_log_page, set_category, get_display_names
+from database import get_category_series, get_usage_totals, get_website_usage_totals
+from daemon import connect_tracker, release_tracker
 from notifier import show_alert
+import metrics
+from aggregation import category_series, heatmap_cube, pick_granularity, range_buckets, CATEGORIES, CATEGORY_CODES
+from singleflight import SingleFlight, Busy
+import analytics
+from categories import SYSTEM_PROCESSES
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """JSON provider that records serialization time per route when metrics are enabled."""
+    def dumps(self, obj, **kwargs):
+        if not metrics.ENABLED:
+            return super().dumps(obj, **kwargs)
+        with metrics.timer('appusage_json_dumps_seconds', _route_label()):
+            return super().dumps(obj, **kwargs)
 
 app = Flask(__name__)
-tracker = Tracker(alert_callback=show_alert)
+app.json = TimedJSONProvider(app)
+# The tracker daemon owns the write path; this is a live view of it (or an in-process
+# tracker). Connected on first use so importing the API never starts a daemon.
+tracker = None
+tracker_lock = threading.Lock()
+
+def get_tracker(spawn_daemon=True):
+    """The tracker, connected on first call. State queries pass spawn_daemon=False and get
+    None rather than starting a daemon just to report that nothing is tracked."""
+    global tracker
+    with tracker_lock:
+        if tracker is None:
+            tracker = connect_tracker(alert_callback=show_alert, spawn_daemon=spawn_daemon)
+        return tracker
+
+def close_tracker():
+    """Stop tracking on exit (see daemon.release_tracker)."""
+    with tracker_lock:
+        release_tracker(tracker)
 tracking_state = {'running': False}
+# Heavy reports: identical concurrent requests share one computation, and at most
+# REPORT_WORKERS distinct ones run at a time
+REPORT_WORKERS = int(os.environ.get('APPUSAGE_REPORT_WORKERS', 2))
+REPORT_QUEUE = int(os.environ.get('APPUSAGE_REPORT_QUEUE', 16))
+reports = SingleFlight(REPORT_WORKERS, REPORT_QUEUE)
+# Address the desktop app serves the API on; set to 0.0.0.0 to take /api/ingest batches
+# from other machines
+DESKTOP_HOST = os.environ.get('APPUSAGE_HOST', '127.0.0.1')
+
 
-SYSTEM_PROCESSES = set([
-    "explorer.exe", "shellexperiencehost.exe", "searchhost.exe",
-    "system", "system idle process", "runtimebroker.exe", "startmenuexperiencehost.exe",
-    "ctfmon.exe", "dwm.exe", "fontdrvhost.exe", "taskhostw.exe", "smartscreen.exe",
-    "securityhealthservice.exe", "searchui.exe", "searchapp.exe", "applicationframehost.exe"
-])
+def _route_label():
+    rule = request.url_rule
+    return f"{request.method} {rule.rule if rule else 'unmatched'}"
+
+@app.before_request
+def metrics_start_timer():
+    if metrics.ENABLED:
+        g.metrics_started = time.perf_counter()
+
+@app.after_request
+def metrics_record_request(response):
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        metrics.observe('appusage_http_request_seconds', _route_label(), time.perf_counter() - started)
+    return response
+
+@app.route('/api/metrics')
+def metrics_api():
+    """Instrumentation counters in Prometheus text format (enable with APPUSAGE_METRICS=1)."""
+    cache = get_query_cache_stats()
+    lines = [
+        '# HELP appusage_query_cache_requests_total Report query cache lookups.',
+        '# TYPE appusage_query_cache_requests_total counter',
+        f'appusage_query_cache_requests_total{{result="hit"}} {cache["hits"]}',
+        f'appusage_query_cache_requests_total{{result="miss"}} {cache["misses"]}',
+        '# HELP appusage_query_cache_evictions_total Entries evicted to stay under the memory cap.',
+        '# TYPE appusage_query_cache_evictions_total counter',
+        f'appusage_query_cache_evictions_total {cache["evictions"]}',
+        '# HELP appusage_query_cache_bytes Estimated size of the cached results.',
+        '# TYPE appusage_query_cache_bytes gauge',
+        f'appusage_query_cache_bytes {cache["bytes"]}',
+        '# HELP appusage_report_requests_total Heavy report requests by outcome.',
+        '# TYPE appusage_report_requests_total counter',
+    ]
+    for outcome, n in sorted(reports.get_stats().items()):
+        if outcome != 'in_flight':
+            lines.append(f'appusage_report_requests_total{{result="{outcome}"}} {n}')
+    return Response(metrics.render_prometheus() + '\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
 
 @app.route('/api/tracking_state')
 def tracking_state_api():
+    tracker = get_tracker(spawn_daemon=False)
+    tracking_state['running'] = tracker is not None and tracker.is_running()
     return jsonify({'running': tracking_state['running']})
 
 @app.route('/api/start_tracking', methods=['POST'])
 def start_tracking():
-    tracker.start()
+    get_tracker().start()
     tracking_state['running'] = True
     return jsonify({'success': True})
 
 @app.route('/api/stop_tracking', methods=['POST'])
 def stop_tracking():
-    tracker.stop()
+    get_tracker().stop()
     tracking_state['running'] = False
     return jsonify({'success': True})
 
+@app.route('/api/tracker_stats')
+def tracker_stats():
+    """Tracker loop health: tick timings, drift and missed deadlines."""
+    tracker = get_tracker(spawn_daemon=False)
+    return jsonify(tracker.get_stats() if tracker else {'running': False})
+
 @app.route('/api/current_app')
 def current_app():
     """Get current active app info for live updates"""
-    if not tracker.is_running():
+    tracker = get_tracker(spawn_daemon=False)
+    if tracker is None or not tracker.is_running():
         return jsonify({'active': False, 'app': None, 'title': None, 'duration': 0})
     
     if tracker.current_app and tracker.start_time:
@@ -60,167 +142,94 @@ def current_app():
         })
     return jsonify({'active': False, 'app': None, 'title': None, 'duration': 0})
 
+MAX_RANGE_DAYS = 3660
+
 @app.route('/api/usage_data')
 def usage_data():
+    """Chart series and summary for a period (today, last_week, last_month), or for any
+    start/end range (YYYY-MM-DD, inclusive) bucketed per hour, day, week or month
+    depending on its length."""
     period = request.args.get('period', 'today')
-    # Expanded sets for categorization
-    PRODUCTIVE = set([
-        # Code editors
-        "vscode", "visual studio code", "pycharm", "sublime", "sublime text", "atom", "webstorm", "intellij", "clion", "android studio", "eclipse", "netbeans", "brackets", "notepad++", "notepadqq", "xcode",
-        # Notes
-        "notion", "onenote", "simplenote", "evernote", "joplin", "obsidian", "standard notes", "google keep", "apple notes",
-        # Office
-        "word", "excel", "powerpoint", "outlook", "onenote", "office", "libreoffice", "openoffice", "google docs", "google sheets", "google slides", "wps office",
-        # Communication/Productivity
-        "teams", "slack", "zoom", "github desktop", "trello", "asana", "todoist", "clickup", "jira", "confluence"
-    ])
-    DISTRACTING = set([
-        # Social/entertainment websites
-        "youtube", "instagram", "facebook", "twitter", "reddit", "tiktok", "netflix", "discord", "pinterest", "tumblr", "twitch", "roblox", "prime video", "quora", "9gag", "bilibili", "vk", "weibo", "imgur", "kick", "onlyfans", "snapchat", "threads", "mastodon", "clubhouse", "soundcloud", "spotify", "apple music", "gaana", "wynk", "jiosaavn", "amazon music", "pandora", "deezer", "audible"
-    ])
-    OTHERS = set([
-        # Browsers
-        "chrome", "google chrome", "firefox", "mozilla firefox", "edge", "microsoft edge", "opera", "brave", "vivaldi", "safari", "chromium",
-        # Music apps
-        "spotify", "itunes", "vlc", "windows media player", "groove music", "winamp", "foobar2000", "audacious", "rhythmbox", "banshee", "amarok", "clementine", "musicbee", "apple music", "amazon music", "youtube music", "pandora", "deezer", "soundcloud", "audible"
-    ])
-    # Define get_category function before using it
-    def get_category(name):
-        n = name.lower()
-        # Productive
-        if any(p in n for p in PRODUCTIVE):
-            return 'Productive'
-        # Distracting (websites and apps)
-        if any(d in n for d in DISTRACTING):
-            return 'Distracting'
-        # Others (browsers, music apps)
-        if any(o in n for o in OTHERS):
-            return 'Others'
-        # Default
-        return 'Others'
-    app_totals = {}
-    site_totals = {}
-    analytics = {}
-    latest_titles = get_latest_window_titles()
-    if period == 'today':
-        today = datetime.now().strftime('%Y-%m-%d')
-        app_hourly = get_usage_by_hour(today)
-        web_hourly = get_website_usage_by_hour(today)
-        hours = [f"{h:02d}" for h in range(24)]
-        data = {h: {"Productive": 0, "Distracting": 0, "Others": 0} for h in hours}
-        for hour, app, minutes in app_hourly:
-            if app.lower() in SYSTEM_PROCESSES:
-                continue
-            cat = get_category(app)
-            data[hour][cat] += minutes
-            app_totals[app] = app_totals.get(app, 0) + minutes
-            analytics[app] = analytics.get(app, 0) + minutes
-        for hour, site, minutes in web_hourly:
-            cat = get_category(site)
-            data[hour][cat] += minutes
-            site_totals[site] = site_totals.get(site, 0) + minutes
-            analytics[site] = analytics.get(site, 0) + minutes
-        labels = hours
-        productive = [data[h]["Productive"] for h in hours]
-        distracting = [data[h]["Distracting"] for h in hours]
-        others = [data[h]["Others"] for h in hours]
+    start = request.args.get('start')
+    end = request.args.get('end')
+    if start or end:
+        today = str(datetime.now().date())
+        start, end = start or end or today, end or today
+        try:
+            days = (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days + 1
+        except ValueError:
+            return jsonify({'success': False, 'error': 'start and end must be YYYY-MM-DD'}), 400
+        if not 1 <= days <= MAX_RANGE_DAYS:
+            return jsonify({'success': False, 'error': f'range must be 1 to {MAX_RANGE_DAYS} days'}), 400
+        key = ('usage_data', start, end)
+        args = ('range', start, end)
+    else:
+        key = ('usage_data', period)
+        args = (period,)
+    try:
+        data = reports.run(key, _usage_report, *args)
+    except Busy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '1'}
+    return jsonify(data)
+
+def _usage_report(period, start=None, end=None):
+    """The /api/usage_data payload; runs on the report pool, outside the request context."""
+    today = datetime.now().date()
+    if period == 'range':
+        first = datetime.strptime(start, '%Y-%m-%d').date()
+        last = datetime.strptime(end, '%Y-%m-%d').date()
+        granularity = pick_granularity((last - first).days + 1)
+        bucket_keys = range_buckets(first, last, granularity)
+        labels = bucket_keys
+    elif period == 'today':
+        first = last = today
+        granularity = 'hour'
+        bucket_keys = range_buckets(first, last, granularity)
+        labels = [key[-2:] for key in bucket_keys]
     elif period == 'last_week':
-        today = datetime.now().date()
-        start = today - timedelta(days=today.weekday())
-        end = start + timedelta(days=6)
-        app_daily = get_usage_by_day(str(start), str(end))
-        web_daily = get_website_usage_by_day(str(start), str(end))
-        days = [(start + timedelta(days=i)).strftime("%a") for i in range(7)]
-        day_keys = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7)]
-        data = {d: {"Productive": 0, "Distracting": 0, "Others": 0} for d in day_keys}
-        for day, app, minutes in app_daily:
-            if app.lower() in SYSTEM_PROCESSES:
-                continue
-            cat = get_category(app)
-            data[day][cat] += minutes
-            app_totals[app] = app_totals.get(app, 0) + minutes
-            analytics[app] = analytics.get(app, 0) + minutes
-        for day, site, minutes in web_daily:
-            cat = get_category(site)
-            data[day][cat] += minutes
-            site_totals[site] = site_totals.get(site, 0) + minutes
-            analytics[site] = analytics.get(site, 0) + minutes
-        labels = days
-        productive = [data[day_keys[i]]["Productive"] for i in range(7)]
-        distracting = [data[day_keys[i]]["Distracting"] for i in range(7)]
-        others = [data[day_keys[i]]["Others"] for i in range(7)]
+        first = today - timedelta(days=today.weekday())
+        last = first + timedelta(days=6)
+        granularity = 'day'
+        bucket_keys = range_buckets(first, last, granularity)
+        labels = [(first + timedelta(days=i)).strftime("%a") for i in range(7)]
     elif period == 'last_month':
-        today = datetime.now().date()
-        # Get the first and last day of the previous month
-        first_of_this_month = today.replace(day=1)
-        last_of_last_month = first_of_this_month - timedelta(days=1)
-        start = last_of_last_month.replace(day=1)
-        end = last_of_last_month
-        app_weekly = get_usage_by_week(str(start), str(end))
-        web_weekly = get_website_usage_by_week(str(start), str(end))
-        # Get all week labels in range
-        def week_label(dt):
-            return dt.strftime("%Y-%W")
-        week_labels = []
-        cur = start
-        while cur <= end:
-            week_labels.append(week_label(cur))
-            cur += timedelta(days=7)
-        data = {w: {"Productive": 0, "Distracting": 0, "Others": 0} for w in week_labels}
-        for week, app, minutes in app_weekly:
-            if app.lower() in SYSTEM_PROCESSES:
-                continue
-            cat = get_category(app)
-            if week not in data:
-                data[week] = {"Productive": 0, "Distracting": 0, "Others": 0}
-            data[week][cat] += minutes
-            app_totals[app] = app_totals.get(app, 0) + minutes
-            analytics[app] = analytics.get(app, 0) + minutes
-        for week, site, minutes in web_weekly:
-            cat = get_category(site)
-            if week not in data:
-                data[week] = {"Productive": 0, "Distracting": 0, "Others": 0}
-            data[week][cat] += minutes
-            site_totals[site] = site_totals.get(site, 0) + minutes
-            analytics[site] = analytics.get(site, 0) + minutes
-        labels = week_labels
-        productive = [data[w]["Productive"] for w in week_labels]
-        distracting = [data[w]["Distracting"] for w in week_labels]
-        others = [data[w]["Others"] for w in week_labels]
+        # The previous calendar month, per week
+        last = today.replace(day=1) - timedelta(days=1)
+        first = last.replace(day=1)
+        granularity = 'week'
+        bucket_keys = range_buckets(first, last, granularity)
+        labels = [max(datetime.strptime(key, '%Y-%m-%d').date(), first).strftime("%Y-%W") for key in bucket_keys]
     else:
+        first = None
+        bucket_keys = []
         labels = []
-        productive = []
-        distracting = []
-        others = []
-    # For widgets
-    filtered_app_totals = {app: mins for app, mins in app_totals.items() if app.lower() not in SYSTEM_PROCESSES}
-    filtered_site_totals = {site: mins for site, mins in site_totals.items() if '.com' not in site.lower()}
-    # Map process name to window title if available
-    def split_on_last_divider(text):
-        # Split on the last occurrence of any divider: |, -, –, —
-        match = re.search(r'(.*)[\|\-–—](.+)', text)
-        if match:
-            return match.group(2).strip().title()
-        return text.strip().title()
-    def display_name(app):
-        title = latest_titles.get(app)
-        if title and title.strip():
-            return split_on_last_divider(title)
-        return app.title()
-    def display_website(site):
-        return split_on_last_divider(site)
-    total_minutes = sum(filtered_app_totals.values())
-    top_productive = sorted([(display_name(app), mins) for app, mins in filtered_app_totals.items() if get_category(app) == 'Productive'], key=lambda x: -x[1])[:3]
-    top_distracting = sorted([(display_name(app), mins) for app, mins in filtered_app_totals.items() if get_category(app) == 'Distracting'], key=lambda x: -x[1])[:3]
-    top_websites = sorted([(display_website(site), mins) for site, mins in filtered_site_totals.items()], key=lambda x: -x[1])[:3]
-    # Use filtered_app_totals for analytics as well
-    analytics_list = sorted([
-        {"name": display_name(k) if k in filtered_app_totals else display_website(k),
-         "minutes": v,
-         "category": get_category(k)}
-        for k, v in analytics.items() if k.lower() not in SYSTEM_PROCESSES and (k in filtered_app_totals or ('.com' not in k.lower()))
-    ], key=lambda x: -x["minutes"])
-    return jsonify({
+    if first is None:
+        series = category_series([], bucket_keys)
+        app_totals = site_totals = []
+    else:
+        # Minutes per bucket and stored category, from the category rollups
+        start, end = str(first), str(last)
+        series = category_series(get_category_series(start, end, granularity), bucket_keys)
+        app_totals = [row for row in get_usage_totals(start, end) if row[0].lower() not in SYSTEM_PROCESSES]
+        site_totals = get_website_usage_totals(start, end)
+    productive = series[:, CATEGORY_CODES['Productive']].tolist()
+    distracting = series[:, CATEGORY_CODES['Distracting']].tolist()
+    others = series[:, CATEGORY_CODES['Others']].tolist()
+    # Apps are shown under the display name stored with their latest title, sites by domain
+    display_names = get_display_names()
+    app_totals = [(display_names.get(app, app), category, mins) for app, category, mins in app_totals]
+    # Totals come most used first
+    total_minutes = sum(mins for _, _, mins in app_totals)
+    top_productive = [(name, mins) for name, category, mins in app_totals if category == 'Productive'][:3]
+    top_distracting = [(name, mins) for name, category, mins in app_totals if category == 'Distracting'][:3]
+    top_websites = [(site, mins) for site, _, mins in site_totals[:3]]
+    analytics_list = sorted(
+        [{"name": name, "minutes": mins, "category": category, "kind": "app"}
+         for name, category, mins in app_totals] +
+        [{"name": site, "minutes": mins, "category": category, "kind": "site"}
+         for site, category, mins in site_totals],
+        key=lambda x: -x["minutes"])
+    data = {
         'labels': labels,
         'productive': productive,
         'distracting': distracting,
@@ -232,7 +241,10 @@ def usage_data():
             'top_websites': top_websites
         },
         'analytics': analytics_list
-    })
+    }
+    if period == 'range':
+        data.update(start=start, end=end, granularity=granularity)
+    return data
 
 @app.route('/')
 def index():
@@ -648,8 +660,8 @@ def index():
         function updateWidgets(summary, analytics) {
             const webs = summary.top_websites.map(([site, mins]) => `<li>${site} <span style='color:#38bdf8'>${formatMinutes(mins)}</span></li>`).join('');
             document.getElementById('top-websites').innerHTML = webs || '<li style="color:#aaa">None</li>';
-            // Show top 3 apps overall, exclude websites ('.com' in name)
-            const topApps = analytics.filter(a => !a.name.toLowerCase().includes('.com')).slice(0, 3);
+            // Show top 3 apps overall, not websites
+            const topApps = analytics.filter(a => a.kind === 'app').slice(0, 3);
             const appList = topApps.map(a => `<li>${a.name} <span style='color:${a.category === 'Productive' ? '#6366f1' : (a.category === 'Distracting' ? '#f59e42' : '#9ca3af')}'>${formatMinutes(a.minutes)}</span></li>`).join('');
             document.getElementById('top-apps').innerHTML = appList || '<li style="color:#aaa">None</li>';
         }
@@ -941,10 +953,15 @@ def on_tray_show_window(icon, item):
 
 def on_tray_exit(icon, item):
     icon.stop()
+    # os._exit skips atexit handlers, so stop tracking first
+    close_tracker()
     os._exit(0)
 
 def setup_tray():
     global tray_icon
+    # GUI-only dependencies are imported here so the API can run on machines without them
+    import pystray
+    from PIL import Image
     image_path = os.path.join(os.path.dirname(__file__), 'static', 'appusage.ico')
     try:
         image = Image.open(image_path)
@@ -962,19 +979,322 @@ def on_window_closing():
     return False  # Prevent window from closing
 
 def run_flask():
-    app.run(port=5000, debug=False, use_reloader=False)
+    # The dashboard window always loads 127.0.0.1, which 0.0.0.0 also serves
+    app.run(host=DESKTOP_HOST, port=5000, debug=False, use_reloader=False)
+
+# --- Export API ---
+def _csv_chunks(columns, chunks):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(rows)
+        yield buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode('utf-8')
+
+def _ndjson_chunks(columns, chunks):
+    for rows in chunks:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows).encode('utf-8')
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+@app.route('/api/export')
+def export_usage():
+    """Stream raw or daily-aggregated usage as CSV or NDJSON, optionally gzipped.
+
+    Query args: kind (usage, website, usage_daily, website_daily), format (csv, ndjson),
+    start/end (YYYY-MM-DD, inclusive, default all history), gzip (1 to compress).
+    """
+    kind = request.args.get('kind', 'usage')
+    fmt = request.args.get('format', 'csv')
+    start = request.args.get('start', '0001-01-01')
+    end = request.args.get('end', '9999-12-31')
+    compress = request.args.get('gzip', '0').lower() in ('1', 'true', 'yes')
+    if kind not in EXPORT_QUERIES:
+        return jsonify({'success': False, 'error': f'Unknown kind: {kind}'}), 400
+    if fmt not in ('csv', 'ndjson'):
+        return jsonify({'success': False, 'error': f'Unknown format: {fmt}'}), 400
+    try:
+        datetime.strptime(start, '%Y-%m-%d')
+        datetime.strptime(end, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'start and end must be YYYY-MM-DD'}), 400
+    columns = EXPORT_QUERIES[kind][0]
+    chunks = iter_export_rows(kind, start, end)
+    body = _csv_chunks(columns, chunks) if fmt == 'csv' else _ndjson_chunks(columns, chunks)
+    filename = f'{kind}.{fmt}'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if compress:
+        body = _gzip_chunks(body)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+@app.route('/api/search')
+def search_api():
+    """Window titles matching q, best match first, with minutes per day.
+
+    Query args: q (words, each matched as a prefix), start/end (YYYY-MM-DD, inclusive,
+    optional), page (from 1) and per_page (at most 100).
+    """
+    query = request.args.get('q', '').strip()
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    if not query:
+        return jsonify({'success': False, 'error': 'q is required'}), 400
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(100, max(1, int(request.args.get('per_page', 20))))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'page and per_page must be integers'}), 400
+    try:
+        for day in (start, end):
+            if day:
+                datetime.strptime(day, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'start and end must be YYYY-MM-DD'}), 400
+    total, rows = search_titles(query, start, end, limit=per_page, offset=(page - 1) * per_page)
+    return jsonify({
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'total': total,
+        'results': [{
+            'title': title,
+            'apps': apps,
+            'minutes': sum(minutes for _, minutes in days),
+            'days': [{'date': day, 'minutes': minutes} for day, minutes in days],
+        } for title, apps, days in rows],
+    })
+
+LOG_COLUMNS = {
+    'usage': ('id', 'app_name', 'title', 'start_time', 'end_time', 'duration', 'host', 'user'),
+    'website': ('id', 'site', 'browser', 'start_time', 'end_time', 'duration', 'host', 'user'),
+}
+
+def encode_cursor(start_time, row_id):
+    return base64.urlsafe_b64encode(json.dumps([start_time, row_id]).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    """(start_time, id) from encode_cursor; ValueError if the token is malformed."""
+    try:
+        start_time, row_id = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception:
+        raise ValueError('invalid cursor')
+    if not isinstance(start_time, str) or not isinstance(row_id, int):
+        raise ValueError('invalid cursor')
+    return start_time, row_id
+
+@app.route('/api/logs')
+def logs_api():
+    """Raw usage or website rows, newest first, a page at a time.
+
+    Query args: kind (usage or website), app (usage) or site (website) exact name, title
+    (usage, substring), start/end (YYYY-MM-DD, inclusive), order (desc or asc), limit (at
+    most 1000) and cursor (next_cursor of the previous page).
+    """
+    kind = request.args.get('kind', 'usage')
+    if kind not in LOG_COLUMNS:
+        return jsonify({'success': False, 'error': f'Unknown kind: {kind}'}), 400
+    name = request.args.get('app' if kind == 'usage' else 'site') or None
+    title = request.args.get('title') or None
+    if kind == 'website' and (request.args.get('app') or title):
+        return jsonify({'success': False, 'error': 'app and title only apply to kind=usage'}), 400
+    if kind == 'usage' and request.args.get('site'):
+        return jsonify({'success': False, 'error': 'site only applies to kind=website'}), 400
+    start = request.args.get('start') or None
+    end = request.args.get('end') or None
+    order = request.args.get('order', 'desc')
+    if order not in ('asc', 'desc'):
+        return jsonify({'success': False, 'error': 'order must be asc or desc'}), 400
+    try:
+        limit = min(1000, max(1, int(request.args.get('limit', 100))))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+    try:
+        for day in (start, end):
+            if day:
+                datetime.strptime(day, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'start and end must be YYYY-MM-DD'}), 400
+    cursor = request.args.get('cursor')
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    rows = get_log_page(kind, limit + 1, after, order == 'asc', name, title, start, end)
+    # One extra row tells whether there is a next page
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return jsonify({
+        'kind': kind,
+        'rows': [dict(zip(LOG_COLUMNS[kind], row)) for row in rows],
+        'next_cursor': encode_cursor(rows[-1][3], rows[-1][0]) if more else None,
+    })
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+
+@app.route('/api/heatmap')
+def heatmap_api():
+    """Minutes per category and hour of day, per weekday (shape=week, 7x24) or per day
+    (shape=days, one row per day), from the hourly aggregates.
+
+    Query args: start/end (YYYY-MM-DD, inclusive, default the last 365 days), shape.
+    """
+    today = datetime.now().date()
+    start = request.args.get('start', str(today - timedelta(days=364)))
+    end = request.args.get('end', str(today))
+    shape = request.args.get('shape', 'week')
+    if shape not in ('week', 'days'):
+        return jsonify({'success': False, 'error': f'Unknown shape: {shape}'}), 400
+    try:
+        days = (datetime.strptime(end, '%Y-%m-%d') - datetime.strptime(start, '%Y-%m-%d')).days + 1
+    except ValueError:
+        return jsonify({'success': False, 'error': 'start and end must be YYYY-MM-DD'}), 400
+    if not 1 <= days <= MAX_RANGE_DAYS:
+        return jsonify({'success': False, 'error': f'range must be 1 to {MAX_RANGE_DAYS} days'}), 400
+    by_weekday = shape == 'week'
+    n_rows, first_slot = (7, 0) if by_weekday else (days, epoch_hour(start + ' 00'))
+    cube = heatmap_cube(get_category_minutes(start, end, by_weekday), n_rows, first_slot)
+    first = datetime.strptime(start, '%Y-%m-%d').date()
+    return jsonify({
+        'start': start,
+        'end': end,
+        'shape': shape,
+        'rows': WEEKDAYS if by_weekday else [str(first + timedelta(days=i)) for i in range(days)],
+        'hours': list(range(24)),
+        'categories': {name: cube[code].tolist() for name, code in CATEGORY_CODES.items()},
+        'total': cube.sum(axis=0).tolist(),
+    })
+
+@app.route('/api/sessions')
+def sessions_api():
+    """Session lengths, context switches per hour and longest focus streaks.
+
+    Query args: start/end (YYYY-MM-DD, inclusive, default the last 30 days), gap (seconds
+    between fragments of one session, default 60) and top (number of streaks, default 10).
+    """
+    today = datetime.now().date()
+    start = request.args.get('start', str(today - timedelta(days=29)))
+    end = request.args.get('end', str(today))
+    try:
+        datetime.strptime(start, '%Y-%m-%d')
+        datetime.strptime(end, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'error': 'start and end must be YYYY-MM-DD'}), 400
+    try:
+        gap = max(0, int(request.args.get('gap', analytics.GAP_SECONDS)))
+        top = min(100, max(1, int(request.args.get('top', 10))))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'gap and top must be integers'}), 400
+    try:
+        report = reports.run(('sessions', start, end, gap, top), analytics.session_report,
+                             start, end, gap, top, SYSTEM_PROCESSES)
+    except Busy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503, {'Retry-After': '1'}
+    return jsonify(dict(report, start=start, end=end, gap=gap))
+
+# --- Ingest API ---
+MAX_INGEST_BYTES = 64 * 1024 * 1024  # decompressed size limit for one batch
+INGEST_FIELDS = {
+    'usage': ('app_name', 'title', 'start_time', 'end_time', 'duration'),
+    'website': ('site', 'browser', 'start_time', 'end_time', 'duration'),
+}
+
+def _read_ingest_body():
+    # Refuse an oversized body before reading it; one without a length is read up to the limit
+    if request.content_length is not None and request.content_length > MAX_INGEST_BYTES:
+        raise ValueError('batch too large')
+    data = request.stream.read(MAX_INGEST_BYTES + 1)
+    if len(data) > MAX_INGEST_BYTES:
+        raise ValueError('batch too large')
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(31)
+        try:
+            data = decompressor.decompress(data, MAX_INGEST_BYTES)
+        except zlib.error:
+            raise ValueError('body is not valid gzip')
+        if decompressor.unconsumed_tail:
+            raise ValueError('batch too large')
+        if not decompressor.eof:
+            raise ValueError('body is not valid gzip')
+    return data
+
+def _parse_ingest_batch(data):
+    """Split an NDJSON batch into its header and usage/website row tuples."""
+    lines = [line for line in data.splitlines() if line.strip()]
+    if not lines:
+        raise ValueError('empty batch')
+    try:
+        header = json.loads(lines[0])
+        host, user, seq = header['host'], header['user'], header['seq']
+    except (ValueError, KeyError, TypeError):
+        raise ValueError('first line must be {"host": ..., "user": ..., "seq": ...}')
+    if not isinstance(host, str) or not isinstance(user, str):
+        raise ValueError('host and user must be strings')
+    if not isinstance(seq, int) or isinstance(seq, bool):
+        raise ValueError('seq must be an integer')
+    rows = {'usage': [], 'website': []}
+    for number, line in enumerate(lines[1:], start=2):
+        try:
+            record = json.loads(line)
+            fields = INGEST_FIELDS[record['type']]
+            row = tuple(record[f] for f in fields)
+        except (ValueError, KeyError, TypeError):
+            raise ValueError(f'line {number}: invalid record')
+        if not isinstance(row[0], str) or not isinstance(row[1], str):
+            raise ValueError(f'line {number}: {fields[0]} and {fields[1]} must be strings')
+        duration = row[4]
+        if isinstance(duration, bool) or not isinstance(duration, (int, float)) or not 0 <= duration < float('inf'):
+            raise ValueError(f'line {number}: duration must be a non-negative number')
+        row = row[:4] + (float(duration),)
+        for ts in (row[2], row[3]):
+            try:
+                datetime.strptime(ts, '%Y-%m-%d %H:%M:%S')
+            except (TypeError, ValueError):
+                raise ValueError(f'line {number}: timestamps must be YYYY-MM-DD HH:MM:SS')
+        rows[record['type']].append(row)
+    return host, user, seq, rows['usage'], rows['website']
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest():
+    """Accept a batch of intervals from a remote tracker.
+
+    The body is NDJSON, optionally sent with Content-Encoding: gzip. The first line is
+    {"host", "user", "seq"}, where seq increases per batch from each client. Every
+    other line is a usage record {"type": "usage", "app_name", "title", "start_time",
+    "end_time", "duration"} or a website record {"type": "website", "site", "browser",
+    ...}. Resending a batch with the same seq is acknowledged without writing again.
+
+    The desktop app listens on 127.0.0.1 unless APPUSAGE_HOST says otherwise (e.g.
+    0.0.0.0); a central instance for remote trackers is usually run with
+    ``main.py --headless --host 0.0.0.0``.
+    """
+    try:
+        host, user, seq, usage_rows, website_rows = _parse_ingest_batch(_read_ingest_body())
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    applied = ingest_batch(host, user, seq, usage_rows, website_rows)
+    return jsonify({'success': True, 'duplicate': not applied,
+                    'usage_rows': len(usage_rows), 'website_rows': len(website_rows)})
 
 # --- App Limits API ---
 @app.route('/api/app_limits')
 def app_limits():
     # Get all used apps (from usage logs) and their limits
-    conn = sqlite3.connect('app_usage.db')
+    apps = get_app_names()
+    conn = get_connection()
     c = conn.cursor()
-    # Ensure usage_logs table exists
-    c.execute('CREATE TABLE IF NOT EXISTS usage_logs (app_name TEXT, title TEXT, start_time TEXT, end_time TEXT, duration REAL)')
-    # Get all used apps
-    c.execute('SELECT DISTINCT app_name FROM usage_logs')
-    apps = [row[0] for row in c.fetchall()]
     # Get all limits
     c.execute('CREATE TABLE IF NOT EXISTS app_limits (app_name TEXT PRIMARY KEY, limit_minutes INTEGER)')
     c.execute('SELECT app_name, limit_minutes FROM app_limits')
@@ -1035,7 +1355,7 @@ def set_app_limit():
     limit_minutes = data.get('limit_minutes')
     if not app_name or limit_minutes is None:
         return jsonify({'success': False, 'error': 'Missing app_name or limit_minutes'}), 400
-    conn = sqlite3.connect('app_usage.db')
+    conn = get_connection()
     c = conn.cursor()
     c.execute('CREATE TABLE IF NOT EXISTS app_limits (app_name TEXT PRIMARY KEY, limit_minutes INTEGER)')
     c.execute('INSERT OR REPLACE INTO app_limits (app_name, limit_minutes) VALUES (?, ?)', (app_name, limit_minutes))
@@ -1043,7 +1363,25 @@ def set_app_limit():
     conn.close()
     return jsonify({'success': True})
 
-if __name__ == '__main__':
+@app.route('/api/set_category', methods=['POST'])
+def set_category_api():
+    """Move an app or site to another category: {"kind": "app" or "site", "name", "category"}."""
+    data = request.get_json(silent=True) or {}
+    table = {'app': 'apps', 'site': 'sites'}.get(data.get('kind'))
+    name = data.get('name')
+    category = data.get('category')
+    if table is None or not name:
+        return jsonify({'success': False, 'error': 'Missing kind (app or site) or name'}), 400
+    if category not in CATEGORIES:
+        return jsonify({'success': False, 'error': f"category must be one of {', '.join(CATEGORIES)}"}), 400
+    if not set_category(table, name, category):
+        return jsonify({'success': False, 'error': f"No {data['kind']} named {name}"}), 404
+    return jsonify({'success': True})
+
+def run_desktop():
+    """Run the API with the pywebview dashboard window and tray icon."""
+    global window
+    import webview
     threading.Thread(target=run_flask, daemon=True).start()
     tray_thread = threading.Thread(target=setup_tray, daemon=True)
     tray_thread.start()
@@ -1053,4 +1391,7 @@ if __name__ == '__main__':
                                    # icon parameter is not supported by pywebview, so we rely on favicon and OS default
     )
     window.events.closing += on_window_closing
-    webview.start() 
\ No newline at end of file
+    webview.start() 
+
+if __name__ == '__main__':
+    run_desktop()